@@ -3,12 +3,11 @@ from jose import JWTError, jwt
 from fuzzywuzzy import fuzz
 from core.config import config
 from fastapi.security import OAuth2PasswordBearer
-from typing import Annotated, List
-from passlib.context import CryptContext
+from typing import Annotated, List, TypedDict
 from core.security import get_password_hash
+from core.authz import token_revoked
 
 
-bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl="api/v1/auth/token")
 
 # return {
@@ -22,11 +21,21 @@ oauth2_bearer = OAuth2PasswordBearer(tokenUrl="api/v1/auth/token")
 # }
 
 
-def get_current_user(token: Annotated[dict, Depends(oauth2_bearer)]):
+class Principal(TypedDict):
+    user_name: str
+    user_id: int
+    # None for tokens issued before these claims existed
+    role: str | None
+    active: bool
+    version: int | None
+
+
+def get_current_user(token: Annotated[dict, Depends(oauth2_bearer)]) -> Principal:
     try:
         payload = jwt.decode(token, config.SECRET_KEY, algorithms=[config.ALGORITHM])
         user_name: str = payload.get("sub")
         user_id: int = payload.get("id")
+        version = payload.get("ver")
 
         if user_name is None or user_id is None:
             raise HTTPException(
@@ -34,7 +43,19 @@ def get_current_user(token: Annotated[dict, Depends(oauth2_bearer)]):
                 detail="Could not validate user",
             )
 
-        return {"user_name": user_name, "user_id": user_id}
+        if token_revoked(user_id, version):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token has been revoked",
+            )
+
+        return {
+            "user_name": user_name,
+            "user_id": user_id,
+            "role": payload.get("role"),
+            "active": payload.get("active", True),
+            "version": version,
+        }
 
     except JWTError:
         print("CANT DECODE JWT")
@@ -43,4 +64,4 @@ def get_current_user(token: Annotated[dict, Depends(oauth2_bearer)]):
         )
 
 
-CurrentUser = Annotated[dict, Depends(get_current_user)]
+CurrentUser = Annotated[Principal, Depends(get_current_user)]
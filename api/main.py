@@ -12,11 +12,15 @@ from .routes import (
     events,
     ranking,
     goaltypes,
-    stadiums
+    stadiums,
+    internal,
 )
 
 router = APIRouter()
 
+router.include_router(
+    internal.route, prefix=config.API_PREFIX_INTERNAL, tags=["internal"]
+)
 router.include_router(stadiums.route, prefix=config.API_PREFIX_STADIUMS, tags=["stadiums"])
 router.include_router(ranking.route, prefix=config.API_PREFIX_RANKING, tags=["ranking"])
 router.include_router(
@@ -2,33 +2,68 @@ from datetime import timedelta, datetime
 from typing import Annotated
 
 from core.db import db_deps
+from core.hashing import HashingBusy
+from core.ratelimit import MemoryBackend, RateLimiter, TooManyAttempts
 from core.security import create_access_token
 from core.config import config
 from jose import jwt
 
 from crud import authenticate_user
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordRequestForm
 from schemas.auth import Token
 from starlette import status
 
 router = APIRouter()
 
+# failed logins, per user name and per client IP
+login_failures = MemoryBackend()
+user_limiter = RateLimiter(
+    login_failures, config.LOGIN_MAX_FAILURES_USER, config.LOGIN_FAILURE_WINDOW
+)
+ip_limiter = RateLimiter(
+    login_failures, config.LOGIN_MAX_FAILURES_IP, config.LOGIN_FAILURE_WINDOW
+)
+
 
 @router.post("/token")
-async def login_for_access_token(
-    form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: db_deps
+def login_for_access_token(
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+    db: db_deps,
+    request: Request,
 ):
+    user_key = "user:" + form_data.username.lower()
+    ip_key = "ip:" + (request.client.host if request.client else "unknown")
+
+    # 429 before spending a password check on a locked out user or client.
+    # The attempt is counted right away and refunded unless it fails, so a
+    # burst of parallel requests cannot all get past the limit
+    user_attempt = user_limiter.acquire(user_key)
+    try:
+        ip_attempt = ip_limiter.acquire(ip_key)
+    except TooManyAttempts:
+        user_limiter.release(user_attempt)
+        raise
+
+    failed = False
     try:
         response = authenticate_user(form_data.username, form_data.password, db)
 
         if response.get("status") == "error":
+            failed = True
             return {"status": "error", "message": "Incorrect username or password."}
 
+        user_limiter.reset(user_key)
+
         user = response.get("data")
 
         token = create_access_token(
-            user.user_name, user.user_id, timedelta(minutes=1440)
+            user.user_name,
+            user.user_id,
+            timedelta(minutes=1440),
+            user.role,
+            bool(user.show),
+            user.token_version or 0,
         )
 
         print(token, config.SECRET_KEY, config.ALGORITHM)
@@ -47,9 +82,17 @@ async def login_for_access_token(
             # },
         }
 
+    except HashingBusy:
+        raise
+
     except HTTPException as e:
         return {"status": "error", "message": str(e.detail)}
 
     except Exception as e:
         print(f"My bad: {str(e)}")
         return {"status": "error", "message": "Internal Server Error."}
+
+    finally:
+        if not failed:
+            user_limiter.release(user_attempt)
+            ip_limiter.release(ip_attempt)
@@ -1,7 +1,11 @@
 from datetime import date
 from sqlalchemy import func
 
-from core.db import db_deps
+from core.db import db_deps, read_db_deps
+from core.standings import standings
+from core.config import config
+from core.fuzzy_index import fuzzy_rows
+from core.search import search
 from fastapi import APIRouter, HTTPException, Depends
 from schemas.db import Clubs, Users, Players
 from schemas.clubs import Club_Response, Club_Create, Club_Update
@@ -16,8 +20,16 @@ from loguru import logger
 route = APIRouter()
 
 
+# visible club whose name fuzzy-matches club_name and is not much longer
+def find_club(db, club_name: str, threshold: int, min_len_ratio: float):
+    for club in fuzzy_rows(db, Clubs, "club_name", club_name, threshold):
+        if min_len_ratio <= len(club_name) / len(club.club_name) <= 1.0:
+            return club
+    return None
+
+
 @route.get("/get-all-clubs")
-async def get_all_clubs(db: db_deps):
+def get_all_clubs(db: read_db_deps):
     try:
         db_clubs = db.query(Clubs).filter(Clubs.show == True).all()
 
@@ -67,18 +79,16 @@ async def get_all_clubs(db: db_deps):
 
 
 @route.get("/search-club-by-name")
-async def search_club_by_name(db: db_deps, search_name: str, threshold: int = 80):
-    db_clubs = db.query(Clubs).filter(Clubs.show == True).all()
+def search_club_by_name(
+    db: db_deps, search_name: str, threshold: int = 80, limit: int = config.SEARCH_LIMIT
+):
+    db_clubs = search(db, Clubs, "club_name", search_name, threshold, limit)
 
-    if not db_clubs:
+    if not db_clubs and not db.query(Clubs).filter(Clubs.show == True).first():
         return {"status": "error", "message": "Can't find any clubs"}
 
     result = []
-    for club in db_clubs:
-        ratio = fuzz.partial_ratio(club.club_name.lower(), search_name.lower())
-        if ratio < threshold:
-            continue
-
+    for club, score in db_clubs:
         manager_full_name = (
             db.query(Users).filter(Users.user_id == club.manager).first().full_name
         )
@@ -94,8 +104,10 @@ async def search_club_by_name(db: db_deps, search_name: str, threshold: int = 80
             total_player=club.total_player,
             manager_id=club.manager,
             manager_name=manager_full_name,
+            logo_high=club.logo_high,
+            logo_low=club.logo_low,
         )
-        result.append(club_data)
+        result.append({**club_data.dict(), "score": score})
 
     if len(result) == 0:
         return {"status": "error", "message": f"No clubs match the name: {search_name}"}
@@ -108,7 +120,7 @@ async def search_club_by_name(db: db_deps, search_name: str, threshold: int = 80
 
 
 @route.get("/search-club-by-manager-id")
-async def search_club_by_manager_id(db: db_deps, manager_search_id: int):
+def search_club_by_manager_id(db: db_deps, manager_search_id: int):
 
     target = (
         db.query(Users)
@@ -153,7 +165,7 @@ async def search_club_by_manager_id(db: db_deps, manager_search_id: int):
     }
 
 @route.get("/manager-get-club")
-async def manager_get_club(db: db_deps, current_user: CurrentUser):
+def manager_get_club(db: db_deps, current_user: CurrentUser):
     #find current user
     user = db.query(Users).filter(Users.show==True, Users.user_id==current_user["user_id"]).first()
 
@@ -174,18 +186,8 @@ async def manager_get_club(db: db_deps, current_user: CurrentUser):
     
 
 @route.get("/get-players-of-clubs/{club_name}")
-async def get_all_players_of_clubs(db: db_deps, club_name: str):
-    db_clubs = db.query(Clubs).filter(Clubs.show == True).all()
-
-    search_club = None
-    for club in db_clubs:
-        len_ = len(club_name) / len(club.club_name)
-        if (
-            fuzz.partial_ratio(club.club_name.lower(), club_name.lower()) >= 98
-            and len_ >= 0.6
-            and len_ <= 1.0
-        ):
-            search_club = club
+def get_all_players_of_clubs(db: db_deps, club_name: str):
+    search_club = find_club(db, club_name, 98, 0.6)
 
     if not search_club:
         return {"status": "error", "message": "Can't find any clubs"}
@@ -213,7 +215,7 @@ async def get_all_players_of_clubs(db: db_deps, club_name: str):
 
 
 @route.post("/create-club")
-async def create_club(db: db_deps, current_user: CurrentUser, new_club: Club_Create):
+def create_club(db: db_deps, current_user: CurrentUser, new_club: Club_Create):
     try:
         hasPermission = check_is_manager(db, current_user)
         created_club = crud_create_club(db, current_user, new_club)
@@ -227,21 +229,11 @@ async def create_club(db: db_deps, current_user: CurrentUser, new_club: Club_Cre
 
 
 @route.put("/update-club/{club_name}")
-async def update_club(
+def update_club(
     db: db_deps, current_user: CurrentUser, club_name: str, new_info: Club_Update
 ):
     try:
-        clubs = db.query(Clubs).filter(Clubs.show == True).all()
-
-        search_club = None
-        for club in clubs:
-            len_ = len(club_name) / len(club.club_name)
-            if (
-                fuzz.partial_ratio(club.club_name.lower(), club_name.lower()) >= 98
-                and len_ >= 0.6
-                and len_ <= 1.0
-            ):
-                search_club = club
+        search_club = find_club(db, club_name, 98, 0.6)
 
         if search_club is None:
             return {"status": "error", "message": "Can't find any clubs"}
@@ -276,19 +268,9 @@ async def update_club(
 
 
 @route.delete("/delete-club")
-async def delete_club(db: db_deps, current_user: CurrentUser, club_name: str):
+def delete_club(db: db_deps, current_user: CurrentUser, club_name: str):
     try:
-        db_clubs = db.query(Clubs).filter(Clubs.show == True).all()
-
-        search_club = None
-        for club in db_clubs:
-            len_ = len(club_name) / len(club.club_name)
-            if (
-                fuzz.partial_ratio(club.club_name.lower(), club_name.lower()) >= 100
-                and len_ >= 0.9
-                and len_ <= 1.0
-            ):
-                search_club = club
+        search_club = find_club(db, club_name, 100, 0.9)
 
         if search_club is None:
             return {"status": "error", "message": "Can't find any clubs"}
@@ -319,6 +301,7 @@ async def delete_club(db: db_deps, current_user: CurrentUser, club_name: str):
         )
         target.show = False
         db.commit()
+        standings.invalidate()
 
         return {
             "status": "success",
@@ -329,7 +312,7 @@ async def delete_club(db: db_deps, current_user: CurrentUser, club_name: str):
 
 
 @route.put("/restore-club")
-async def restore_club(db: db_deps, current_user: CurrentUser, club_name: str):
+def restore_club(db: db_deps, current_user: CurrentUser, club_name: str):
     try:
         db_clubs = db.query(Clubs).filter(Clubs.show == False).all()
 
@@ -374,6 +357,7 @@ async def restore_club(db: db_deps, current_user: CurrentUser, club_name: str):
         )
         target.show = True
         db.commit()
+        standings.invalidate()
 
         return {
             "status": "success",
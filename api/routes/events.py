@@ -1,9 +1,18 @@
+from collections import Counter
+from datetime import timedelta
+from typing import List
+
 from fastapi import APIRouter, HTTPException
-from sqlalchemy import func, or_
+from sqlalchemy import func, or_, tuple_
 from sqlalchemy.orm import Session
 
 from api.deps import CurrentUser
-from core.db import db_deps
+from core.config import config
+from core.db import db_deps, get_params
+from core.export import parse_format, stream_query, visible_rows
+from core.fuzzy_index import fuzzy_ids
+from core.live import publish_match
+from core.pagination import paginate
 from schemas.db import Clubs, Players, Users, Params, Matches, Events, GoalTypes
 from schemas.events import EventAdd, EventUpdate
 
@@ -13,24 +22,33 @@ from utils import (
     convert_from_attr,
     count_goals,
     to_second,
-    update_match,
+    apply_goal_deltas,
 )
 
 route = APIRouter()
 
 
 @route.get("/")
-async def default(db: db_deps):
-    db_events = db.query(Events).filter(Events.show == True).all()
+def default(db: db_deps, limit: int = None, cursor: str = None):
+    db_events, next_cursor = paginate(
+        db.query(Events).filter(Events.show == True), (Events.event_id,), limit, cursor
+    )
     return {
         "status": "success",
         "message": "Events retrieved successfully",
         "data": db_events,
+        "next_cursor": next_cursor,
     }
 
 
+# every visible event as an NDJSON or CSV download, see core/export.py
+@route.get("/export")
+def export_events(current_user: CurrentUser, format: str = "ndjson"):
+    return stream_query(visible_rows(Events), parse_format(format), "events")
+
+
 @route.get("/get-events-of-match")
-async def get_events_of_match(db: db_deps, match_id: int):
+def get_events_of_match(db: db_deps, match_id: int):
     events = (
         db.query(Events).filter(Events.show == True, Events.match_id == match_id).all()
     )
@@ -50,7 +68,7 @@ async def get_events_of_match(db: db_deps, match_id: int):
 
 
 @route.post("/add")
-async def add_event(
+def add_event(
     db: db_deps,
     current_user: CurrentUser,
     event: EventAdd,
@@ -100,7 +118,7 @@ async def add_event(
         return res
 
     event_name = convert_from_attr(
-        GoalTypes, event.events, "type_name", "type_id", True
+        db, GoalTypes, event.events, "type_name", "type_id", True
     )
     if not event_name:
         return {
@@ -127,7 +145,6 @@ async def add_event(
 
     # if no conflict -> add
     new_event = Events(
-        event_id=1 + (db.query(func.max(Events.event_id)).scalar() or 0),
         match_id=event.match_id,
         events=event.events.upper(),
         seconds=event.seconds,
@@ -137,11 +154,12 @@ async def add_event(
     )
 
     db.add(new_event)
-    db.commit()
-    db.refresh(new_event)
 
-    # update match
-    update_match(db, match.match_id)
+    # update match, in the same transaction
+    targets = apply_goal_deltas(db, [(new_event.match_id, new_event.team_id, 1)])
+    db.refresh(new_event)
+    for target in targets.values():
+        publish_match(target, "event_added", [new_event])
 
     return {
         "status": "success",
@@ -150,6 +168,121 @@ async def add_event(
     }
 
 
+# Add many events in one transaction, e.g. from a live feed. The same
+# checks as /add, but each done once for the whole batch with set-based
+# queries; either every event is added or none and the errors are listed
+# by position. Scores move once per match and team.
+@route.post("/add-batch")
+def add_events(
+    db: db_deps,
+    current_user: CurrentUser,
+    events: List[EventAdd],
+):
+    is_admin(db, current_user)
+
+    if not events:
+        return {"status": "error", "message": "No events to add!"}
+    if len(events) > config.EVENT_BATCH_SIZE:
+        return {
+            "status": "error",
+            "message": f"At most {config.EVENT_BATCH_SIZE} events per batch!",
+        }
+
+    match_ids = {event.match_id for event in events}
+    matches = {
+        match.match_id: match
+        for match in db.query(Matches).filter(
+            Matches.show == True, Matches.match_id.in_(match_ids)
+        )
+    }
+    players = {
+        player.player_id: player
+        for player in db.query(Players).filter(
+            Players.show == True,
+            Players.player_id.in_({event.player_id for event in events}),
+        )
+    }
+    slots = {(event.match_id, event.seconds) for event in events}
+    taken = set(
+        db.query(Events.match_id, Events.seconds)
+        .filter(
+            Events.show == True,
+            Events.match_id.in_(match_ids),
+            tuple_(Events.match_id, Events.seconds).in_(slots),
+        )
+        .all()
+    )
+    event_names = {
+        name: bool(fuzzy_ids(db, GoalTypes, "type_name", name, 91))
+        for name in {event.events for event in events}
+    }
+    max_goal_time = get_params(Params, db).max_goal_time
+
+    errors = []
+    for i, event in enumerate(events):
+        match = matches.get(event.match_id)
+        player = players.get(event.player_id)
+
+        if not match:
+            message = "Can't find match!"
+        elif not player or player.player_club not in (match.team1, match.team2):
+            message = "Can't find player!"
+        elif event.team_id != player.player_club:
+            message = "The player is not in this team ID!"
+        elif event.seconds > max_goal_time:
+            message = (
+                "The goal time is invalid. "
+                f"Max goal time is {timedelta(seconds=max_goal_time)} !"
+            )
+        elif not event_names[event.events]:
+            message = "Invalid event name!"
+        elif (event.match_id, event.seconds) in taken:
+            message = "Duplicated event!"
+        else:
+            taken.add((event.match_id, event.seconds))
+            continue
+
+        errors.append({"index": i, "message": message})
+
+    if errors:
+        return {"status": "error", "message": "Invalid events!", "data": errors}
+
+    new_events = [
+        Events(
+            match_id=event.match_id,
+            events=event.events.upper(),
+            seconds=event.seconds,
+            player_id=event.player_id,
+            team_id=event.team_id,
+            show=True,
+        )
+        for event in events
+    ]
+    db.add_all(new_events)
+    # the ids come back from the sequence in one multi-row INSERT .. RETURNING
+    db.flush()
+    # built now, reading them back after the commit would cost a query each
+    data = [
+        {column.key: getattr(event, column.key) for column in Events.__table__.c}
+        for event in new_events
+    ]
+
+    # update matches, in the same transaction
+    goals = Counter((event.match_id, event.team_id) for event in events)
+    targets = apply_goal_deltas(
+        db, [(match_id, team_id, n) for (match_id, team_id), n in goals.items()]
+    )
+    for match_id, target in targets.items():
+        added = [event for event in data if event["match_id"] == match_id]
+        publish_match(target, "event_added", added)
+
+    return {
+        "status": "success",
+        "message": f"Added {len(new_events)} events successfully!",
+        "data": data,
+    }
+
+
 # update
 @route.put("/update")
 def update_event(
@@ -216,7 +349,7 @@ def update_event(
         return res
 
     event_name = convert_from_attr(
-        GoalTypes, event.events, "type_name", "type_id", True
+        db, GoalTypes, event.events, "type_name", "type_id", True
     )
 
     if not event_name:
@@ -225,6 +358,14 @@ def update_event(
             "message": "Invalid event name!",
         }
 
+    # the goal moves if the match or team changes
+    deltas = []
+    if (target.match_id, target.team_id) != (event.match_id, event.team_id):
+        deltas = [
+            (target.match_id, target.team_id, -1),
+            (event.match_id, event.team_id, 1),
+        ]
+
     # check duplicate
     target.match_id = event.match_id
     target.events = event.events
@@ -232,11 +373,11 @@ def update_event(
     target.player_id = event.player_id
     target.team_id = event.team_id
 
-    db.commit()
+    # update match, in the same transaction
+    targets = apply_goal_deltas(db, deltas)
     db.refresh(target)
-
-    # update match
-    update_match(db, match.match_id)
+    for changed in list(targets.values()) or [match]:
+        publish_match(changed, "event_updated", [target])
 
     return {
         "status": "success",
@@ -247,7 +388,7 @@ def update_event(
 
 # DELETE
 @route.put("/delete")
-async def delete_event(
+def delete_event(
     db: db_deps,
     current_user: CurrentUser,
     event_id: int,
@@ -270,11 +411,11 @@ async def delete_event(
 
     target.show = False
 
-    db.commit()
+    # update match, in the same transaction
+    targets = apply_goal_deltas(db, [(target.match_id, target.team_id, -1)])
     db.refresh(target)
-
-    # update match
-    update_match(db, target.match_id)
+    for match in targets.values():
+        publish_match(match, "event_deleted", [target])
 
     return {
         "status": "success",
@@ -285,7 +426,7 @@ async def delete_event(
 
 # DELETE from DATABASE
 @route.put("/delete-permanently")
-async def delete_event_permanently(
+def delete_event_permanently(
     db: db_deps,
     current_user: CurrentUser,
     event_id: int,
@@ -312,7 +453,7 @@ async def delete_event_permanently(
 
 
 @route.put("/restore")
-async def restore_event(
+def restore_event(
     db: db_deps,
     current_user: CurrentUser,
     event_id: int,
@@ -334,8 +475,11 @@ async def restore_event(
 
     target.show = True
 
-    db.commit()
+    # update match, in the same transaction
+    targets = apply_goal_deltas(db, [(target.match_id, target.team_id, 1)])
     db.refresh(target)
+    for match in targets.values():
+        publish_match(match, "event_restored", [target])
     return {
         "status": "success",
         "message": "Restored successfully",
@@ -344,7 +488,7 @@ async def restore_event(
 
 
 @route.get("/count")
-async def count_goals_of_match(
+def count_goals_of_match(
     db: db_deps,
     current_user: CurrentUser,
     id: int,
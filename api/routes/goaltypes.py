@@ -18,7 +18,7 @@ def json_response(status: str, message: str, data: dict = None):
 
 
 @route.get("/get")
-async def get_goal_types(db: db_deps, current_user: CurrentUser):
+def get_goal_types(db: db_deps, current_user: CurrentUser):
     is_admin(db, current_user)
 
     get = db.query(GoalTypes).filter(GoalTypes.show == True).all()
@@ -26,7 +26,7 @@ async def get_goal_types(db: db_deps, current_user: CurrentUser):
 
 
 @route.post("/add-types")
-async def add_types(db: db_deps, current_user: CurrentUser, new_type: str):
+def add_types(db: db_deps, current_user: CurrentUser, new_type: str):
     is_admin(db, current_user)
 
     # check duplicated
@@ -42,10 +42,7 @@ async def add_types(db: db_deps, current_user: CurrentUser, new_type: str):
         db.commit()
         return dup
 
-    max_id = db.query(func.max(GoalTypes.type_id)).scalar()
-    new_db_type = GoalTypes(
-        type_id=(max_id or 0) + 1, type_name=new_type.upper(), show=True
-    )
+    new_db_type = GoalTypes(type_name=new_type.upper(), show=True)
 
     db.add(new_db_type)
     db.commit()
@@ -54,7 +51,7 @@ async def add_types(db: db_deps, current_user: CurrentUser, new_type: str):
 
 
 @route.put("/delete-types")
-async def delete_types(db: db_deps, current_user: CurrentUser, type_name: str):
+def delete_types(db: db_deps, current_user: CurrentUser, type_name: str):
     is_admin(db, current_user)
 
     # find target
@@ -91,7 +88,7 @@ async def delete_types(db: db_deps, current_user: CurrentUser, type_name: str):
 
 
 @route.put("/rename-type")
-async def rename_type(
+def rename_type(
     db: db_deps, current_user: CurrentUser, type_name: str, new_name: str
 ):
     is_admin(db, current_user)
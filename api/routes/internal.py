@@ -0,0 +1,43 @@
+from fastapi import APIRouter
+
+from api.deps import CurrentUser
+from core.db import db as code_db
+from core.db import db_deps
+from core.live import live
+from core.security import hashing_pool
+from utils import is_admin
+
+route = APIRouter()
+
+
+@route.get("/pool")
+def pool_status(db: db_deps, current_user: CurrentUser):
+    is_admin(db, current_user)
+
+    return {
+        "status": "success",
+        "message": "Connection pool status retrieved successfully",
+        "data": code_db.pool_status(),
+    }
+
+
+@route.get("/hashing")
+def hashing_status(db: db_deps, current_user: CurrentUser):
+    is_admin(db, current_user)
+
+    return {
+        "status": "success",
+        "message": "Hashing pool status retrieved successfully",
+        "data": hashing_pool.status(),
+    }
+
+
+@route.get("/live")
+def live_status(db: db_deps, current_user: CurrentUser):
+    is_admin(db, current_user)
+
+    return {
+        "status": "success",
+        "message": "Live score subscribers retrieved successfully",
+        "data": live.status(),
+    }
@@ -1,14 +1,23 @@
-from datetime import date, time, datetime
+import asyncio
+from datetime import date, time, datetime, timedelta
 
 from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
 from fuzzywuzzy import fuzz
 from sqlalchemy import func, or_
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from starlette.responses import JSONResponse
 
 from api.deps import CurrentUser, List
-from core.db import db_deps, Depends
+from core.config import config
+from core.db import db as database
+from core.db import db_deps, read_db_deps, Depends
+from core.export import parse_format, stream_query
+from core.live import live, match_topic, publish_match, round_topic, sse
+from core.match_listing import match_query, match_rows, parse_expand
+from core.standings import standings
 from schemas.db import Clubs, Players, Users, Params, Matches, Referees
-from schemas.matches import AddMatch, MatchResponse, MatchUpdate
+from schemas.matches import AddMatch, MatchUpdate
 
 from loguru import logger
 
@@ -35,137 +44,159 @@ async def custom_http_exception_handler(request: Request, exc: HTTPException):
     )
 
 
+# ?expand=teams,stadium,referees adds the names behind the ids, see
+# core/match_listing.py. Pages of `limit` matches by start time; pass the
+# returned next_cursor as `cursor` for the next one
 @route.get("/get-matches")
-async def get_matches(db: db_deps):
-    db_matches = db.query(Matches).filter(Matches.show == True).all()
-    res_list = []
-
-    for match in db_matches:
-        now = datetime.now()
-        now_unix = now.timestamp()
-
-        res = MatchResponse(
-            match_id=match.match_id,
-            team1=match.team1,
-            team2=match.team2,
-            start=match.start,
-            finish=match.finish,
-            goal1=match.goal1,
-            goal2=match.goal2,
-            stadium=match.stadium,
-            ref=match.ref_id,
-            var=match.var_id,
-            lineman=match.lineman_id,
-        )
-
-        res_list.append(res)
+def get_matches(
+    db: read_db_deps, expand: str = None, limit: int = None, cursor: str = None
+):
+    res_list, next_cursor = match_rows(
+        db, parse_expand(expand), limit=limit, cursor=cursor
+    )
 
-    return {
-        "status": "success",
-        "message": "Matches retrieved successfully",
-        "data": res_list,
-    }
+    return ORJSONResponse(
+        {
+            "status": "success",
+            "message": "Matches retrieved successfully",
+            "data": res_list,
+            "next_cursor": next_cursor,
+        }
+    )
 
 
 @route.get("/filter-matches-by-team-name")
-async def get_matches_by_team_name(db: db_deps, club: str):
-    search = convert_from_attr(Clubs, club, "club_name", "club_id", True)
-
-    db_matches = (
-        db.query(Matches)
-        .filter(
-            Matches.show == True, or_(Matches.team1 == search, Matches.team2 == search)
-        )
-        .all()
+def get_matches_by_team_name(
+    db: db_deps,
+    club: str,
+    expand: str = None,
+    limit: int = None,
+    cursor: str = None,
+):
+    expand = parse_expand(expand)
+    search = convert_from_attr(db, Clubs, club, "club_name", "club_id", True)
+
+    res_list, next_cursor = match_rows(
+        db,
+        expand,
+        or_(Matches.team1 == search, Matches.team2 == search),
+        limit=limit,
+        cursor=cursor,
+    )
+    return ORJSONResponse(
+        {
+            "status": "success",
+            "message": "Matches filtered by team name successfully",
+            "data": res_list,
+            "next_cursor": next_cursor,
+        }
     )
-
-    res_list = []
-    for match in db_matches:
-        res = MatchResponse(
-            match_id=match.match_id,
-            team1=match.team1,
-            team2=match.team2,
-            start=match.start,
-            finish=match.finish,
-            goal1=match.goal1,
-            goal2=match.goal2,
-            stadium=match.stadium,
-            ref=match.ref_id,
-            var=match.var_id,
-            lineman=match.lineman_id,
-        )
-        res_list.append(res)
-    return {
-        "status": "success",
-        "message": "Matches filtered by team name successfully",
-        "data": res_list,
-    }
 
 
 # get unfinished matches
 @route.get("/fixtures")
-async def get_fixtures(db: db_deps):
-    db_matches = (
-        db.query(Matches).filter(Matches.show == True, Matches.goal1 == None).all()
+def get_fixtures(
+    db: db_deps, expand: str = None, limit: int = None, cursor: str = None
+):
+    res_list, next_cursor = match_rows(
+        db, parse_expand(expand), Matches.goal1 == None, limit=limit, cursor=cursor
     )
 
-    res_list = []
-    for match in db_matches:
-        res = MatchResponse(
-            match_id=match.match_id,
-            team1=match.team1,
-            team2=match.team2,
-            start=match.start,
-            finish=match.finish,
-            goal1=match.goal1,
-            goal2=match.goal2,
-            stadium=match.stadium,
-            ref=match.ref_id,
-            var=match.var_id,
-            lineman=match.lineman_id,
-        )
-        res_list.append(res)
-    return {
-        "status": "success",
-        "message": "Fixtures retrieved successfully",
-        "data": res_list,
-    }
+    return ORJSONResponse(
+        {
+            "status": "success",
+            "message": "Fixtures retrieved successfully",
+            "data": res_list,
+            "next_cursor": next_cursor,
+        }
+    )
 
 
 # get result = get finished matches
 @route.get("/results")
-async def get_matches_results(db: db_deps):
-    db_matches = (
-        db.query(Matches).filter(Matches.show == True, Matches.goal1 != None).all()
+def get_matches_results(
+    db: db_deps, expand: str = None, limit: int = None, cursor: str = None
+):
+    res_list, next_cursor = match_rows(
+        db, parse_expand(expand), Matches.goal1 != None, limit=limit, cursor=cursor
     )
 
-    res_list = []
-    for match in db_matches:
-        res = MatchResponse(
-            match_id=match.match_id,
-            team1=match.team1,
-            team2=match.team2,
-            start=match.start,
-            finish=match.finish,
-            goal1=match.goal1,
-            goal2=match.goal2,
-            stadium=match.stadium,
-            ref=match.ref_id,
-            var=match.var_id,
-            lineman=match.lineman_id,
-        )
-        res_list.append(res)
+    return ORJSONResponse(
+        {
+            "status": "success",
+            "message": "Match results retrieved successfully",
+            "data": res_list,
+            "next_cursor": next_cursor,
+        }
+    )
 
-    return {
-        "status": "success",
-        "message": "Match results retrieved successfully",
-        "data": res_list,
-    }
+
+# every visible match as an NDJSON or CSV download, see core/export.py
+@route.get("/export")
+def export_matches(
+    current_user: CurrentUser, format: str = "ndjson", expand: str = None
+):
+    format = parse_format(format)
+    query = (
+        match_query(parse_expand(expand))
+        .where(Matches.show == True)
+        .order_by(Matches.start, Matches.match_id)
+    )
+    return stream_query(query, format, "matches")
+
+
+# Server-sent events: a "snapshot" of the match(es) with club names, then
+# event_added / event_updated / event_deleted / event_restored /
+# result_updated frames carrying the new score (and the ids of the changed
+# events) as they are committed, see core/live.py. After a "resync" frame
+# the client missed updates and should reconnect.
+def live_stream(topic: str, *filters) -> StreamingResponse:
+    def snapshot():
+        query = match_query({"teams"}).where(Matches.show == True, *filters)
+        with database.session() as db:
+            return [dict(row) for row in db.execute(query).mappings()]
+
+    async def frames():
+        # subscribed before the snapshot is read, so nothing falls in between
+        subscription = live.subscribe(topic)
+        try:
+            yield sse("snapshot", await run_in_threadpool(snapshot))
+            while True:
+                try:
+                    yield await asyncio.wait_for(
+                        subscription.queue.get(), config.LIVE_KEEPALIVE
+                    )
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+        finally:
+            live.unsubscribe(subscription)
+
+    return StreamingResponse(
+        frames(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@route.get("/live/{match_id}")
+async def live_match(match_id: int):
+    return live_stream(match_topic(match_id), Matches.match_id == match_id)
+
+
+# every match kicking off on `day` (YYYY-MM-DD, server time), the matchdays
+# the standings count rounds by
+@route.get("/live/round/{day}")
+async def live_round(day: date):
+    start = datetime.combine(day, time()).timestamp()
+    end = datetime.combine(day + timedelta(days=1), time()).timestamp()
+    return live_stream(
+        round_topic(day), Matches.start >= start, Matches.start < end
+    )
 
 
 # ADD MATCH: can handle string input or id input
 @route.post("/add-match")
-async def add_match(db: db_deps, current_user: CurrentUser, match: AddMatch):
+def add_match(db: db_deps, current_user: CurrentUser, match: AddMatch):
     is_admin(db, current_user)
 
     match_return = valid_add_match(
@@ -178,11 +209,8 @@ async def add_match(db: db_deps, current_user: CurrentUser, match: AddMatch):
     db_match.start = min(db_match.start, 2 * 10**9)
     db_match.finish = min(db_match.finish, 2 * 10**9)
 
-
     # auto complete goal1, goal2 and show
-    max_id = db.query(func.max(Matches.match_id)).scalar()
     new_match = Matches(
-        match_id=(max_id or 0) + 1,
         team1=db_match.team1,
         team2=db_match.team2,
         start=db_match.start,
@@ -199,6 +227,7 @@ async def add_match(db: db_deps, current_user: CurrentUser, match: AddMatch):
     db.add(new_match)
     db.commit()
     db.refresh(new_match)
+    standings.apply_match(db, new_match)
 
     return {
         "status": "success",
@@ -208,9 +237,7 @@ async def add_match(db: db_deps, current_user: CurrentUser, match: AddMatch):
 
 
 @route.put("/update-match")
-async def update_match(
-    db: db_deps, current_user: CurrentUser, update: MatchUpdate, id: int
-):
+def update_match(db: db_deps, current_user: CurrentUser, update: MatchUpdate, id: int):
     is_admin(db, current_user)
 
     # search for the match user want to udpate
@@ -251,6 +278,8 @@ async def update_match(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+    standings.apply_match(db, target)
+
     return {
         "status": "success",
         "message": "Match updated successfully",
@@ -259,7 +288,7 @@ async def update_match(
 
 
 @route.put("/update-result")
-async def update_result(
+def update_result(
     db: db_deps, current_user: CurrentUser, id: int, goal1: int, goal2: int
 ):
     is_admin(db, current_user)
@@ -287,6 +316,8 @@ async def update_result(
 
     db.commit()
     db.refresh(target)
+    standings.apply_match(db, target)
+    publish_match(target, "result_updated")
 
     return {
         "status": "success",
@@ -297,7 +328,7 @@ async def update_result(
 
 # DELETE
 @route.put("/delete-match")
-async def delete_match(db: db_deps, current_user: CurrentUser, id: int):
+def delete_match(db: db_deps, current_user: CurrentUser, id: int):
     is_admin(db, current_user)
     target = (
         db.query(Matches).filter(Matches.show == True, Matches.match_id == id).first()
@@ -310,6 +341,7 @@ async def delete_match(db: db_deps, current_user: CurrentUser, id: int):
 
     db.commit()
     db.refresh(target)
+    standings.apply_match(db, target)
 
     return {
         "status": "success",
@@ -320,7 +352,7 @@ async def delete_match(db: db_deps, current_user: CurrentUser, id: int):
 
 # delete permanently
 @route.delete("/permanently-delete-match")
-async def permanently_delete_match(db: db_deps, current_user: CurrentUser, id: int):
+def permanently_delete_match(db: db_deps, current_user: CurrentUser, id: int):
     is_admin(db, current_user)
     target = (
         db.query(Matches).filter(Matches.show == False, Matches.match_id == id).first()
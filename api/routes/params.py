@@ -5,7 +5,8 @@ from fuzzywuzzy import fuzz
 from sqlalchemy import func, or_, text
 
 from api.deps import CurrentUser, List
-from core.db import db_deps, Depends
+from core.authz import get_principal_access
+from core.db import db_deps, Depends, params_cache
 from schemas.db import Clubs, Players, Users, Params, Events, GoalTypes
 from schemas.params import Show_Params, Update_Params, Annotated, GoalTypeAdd
 from utils import (
@@ -23,9 +24,10 @@ route = APIRouter()
 def count_goal_types(db: db_deps):
     count = db.query(GoalTypes).filter(GoalTypes.show == True).count()
     params = db.query(Params).filter(Params.id == 1).first()
-    params.max_goal_types = count
-
-    db.commit()
+    if params.max_goal_types != count:
+        params.max_goal_types = count
+        db.commit()
+        params_cache.bump()
     return count
 
 
@@ -36,12 +38,10 @@ def is_admin(db: db_deps, current_user: CurrentUser):
             detail={"status": "error", "message": "Authentication Failed"},
         )
 
-    user_role = (
-        db.query(Users).filter(Users.user_id == current_user["user_id"]).first().role  # type: ignore
-    )
+    access = get_principal_access(db, current_user)
 
     # check permission of user_role
-    if user_role != "admin":
+    if access is None or access.role != "admin":
         raise HTTPException(
             status_code=401,
             detail={
@@ -55,7 +55,7 @@ def is_admin(db: db_deps, current_user: CurrentUser):
 
 # GET
 @route.get("/show-params/")
-async def show_params(db: db_deps, current_user: CurrentUser):
+def show_params(db: db_deps, current_user: CurrentUser):
     is_admin(db, current_user)
     count_goal_types(db)
 
@@ -75,7 +75,7 @@ async def show_params(db: db_deps, current_user: CurrentUser):
 
 # UPDATE
 @route.put("/update-params/")
-async def update_params(
+def update_params(
     db: db_deps, current_user: CurrentUser, new_info: Update_Params
 ):
     # Admin only
@@ -182,6 +182,7 @@ async def update_params(
         setattr(params, key, value)
 
     db.commit()
+    params_cache.bump()
 
     db.refresh(params)
 
@@ -193,7 +194,7 @@ async def update_params(
 
 
 @route.post("/add-goal-type")
-async def add_goal_type(db: db_deps, current_user: CurrentUser, new_goal_type: str):
+def add_goal_type(db: db_deps, current_user: CurrentUser, new_goal_type: str):
     is_admin(db, current_user)
     duplicated = (
         db.query(GoalTypes)
@@ -207,24 +208,16 @@ async def add_goal_type(db: db_deps, current_user: CurrentUser, new_goal_type: s
             detail={"status": "error", "message": "Type name already existed!"},
         )
 
-    type_id = (1 + (db.query(func.max(GoalTypes.type_id)).scalar() or 0),)
-    sql_command = text(
-        """
-    INSERT INTO goaltypes (type_id, type_name, show)
-    VALUES (:type_id, :type_name, :show);
-    """
-    )
+    # type_id comes from the table's sequence
     try:
-        result = db.execute(
-            sql_command, {"type_id": type_id, "type_name": new_goal_type, "show": True}
-        )
+        db.add(GoalTypes(type_name=new_goal_type, show=True))
+        db.commit()
     except Exception as e:
         db.rollback()
         raise HTTPException(
             status_code=400, detail={"status": "error", "message": str(e)}
         )
 
-    db.commit()
     # Update max_goal_types
     count_goal_types(db)
 
@@ -232,7 +225,7 @@ async def add_goal_type(db: db_deps, current_user: CurrentUser, new_goal_type: s
 
 
 @route.post("/delete-goal-type")
-async def delete_goal_type(db: db_deps, current_user: CurrentUser, type_id: int):
+def delete_goal_type(db: db_deps, current_user: CurrentUser, type_id: int):
     # find the goal type
     target = (
         db.query(GoalTypes)
@@ -1,10 +1,15 @@
 from datetime import date, datetime
 from fastapi import APIRouter, Depends, FastAPI, HTTPException
-from fuzzywuzzy import fuzz
+from core.authz import check_permission
+from core.config import config
+from core.export import parse_format, stream_query, visible_rows
+from core.fuzzy_index import fuzzy_values
+from core.pagination import paginate
+from core.search import search
 from sqlalchemy import func
 from api.deps import CurrentUser, List
 from core.db import db as code_db
-from core.db import db_deps
+from core.db import db_deps, read_db_deps
 from schemas.db import Clubs, Players, Users, Events
 from schemas.players import PlayerCreate, PlayerShow, PlayerUpdate, Player_Add_With_Club
 from utils import is_valid_age, MIN_CLUB_PLAYER, MAX_CLUB_PLAYER
@@ -61,35 +66,16 @@ def create_player_res_with_goals(db: db_deps, player):
 
 
 def get_user_permission(db: db_deps, current_user: CurrentUser, role: str):
-    if current_user is None:
-        return {"status": "error", "message": "Authentication Failed"}
-
-    user_role = (
-        db.query(Users).filter(Users.user_id == current_user["user_id"]).first().role
-    )
-
-    if role == "manager":
-        if (
-            not db.query(Users)
-            .filter(Users.user_id == current_user["user_id"])
-            .first()
-            .show
-        ):
-            return {"status": "error", "message": "Your account is no longer active!"}
-
-        return {"status": "success"}
-
-    elif role == "admin" and user_role != role:
-        return {
-            "status": "error",
-            "message": "You don't have permission to do this action!",
-        }
+    try:
+        check_permission(db, current_user, role)
+    except HTTPException as e:
+        return e.detail
 
     return {"status": "success"}
 
 
 @route.post("/add-players")
-async def add_players(player: PlayerCreate, db: db_deps, current_user: CurrentUser):
+def add_players(player: PlayerCreate, db: db_deps, current_user: CurrentUser):
     permission_result = get_user_permission(db, current_user, "manager")
 
     if permission_result["status"] == "error":
@@ -116,8 +102,6 @@ async def add_players(player: PlayerCreate, db: db_deps, current_user: CurrentUs
             if key == "player_bday" and not is_valid_age(value):
                 return {"status": "error", "message": "Player age is not legal"}
 
-        count = db.query(func.max(Players.player_id)).scalar()
-        newPlayerDict["player_id"] = (count or 0) + 1
         new_db_player = Players(**newPlayerDict)
 
         club = (
@@ -154,80 +138,77 @@ async def add_players(player: PlayerCreate, db: db_deps, current_user: CurrentUs
 
 
 @route.get("/get-players")
-async def get_players(
-    db: db_deps,
+def get_players(
+    db: read_db_deps,
     full_name: str = None,
     club_name: str = None,
     position: str = None,
     nation: str = None,
     threshold: int = 80,
+    limit: int = None,
+    cursor: str = None,
 ):
     try:
-        players = db.query(Players).filter(Players.show == True).all()
+        filters = [Players.show == True]
 
-        if not players:
-            return {"status": "error", "message": "No players found"}
-
-        matched_players = players
-
-        if full_name:
-            matched_players = [
-                player
-                for player in matched_players
-                if fuzz.partial_ratio(player.player_name.lower(), full_name.lower())
-                >= threshold
-            ]
+        for value, field in ((position, "player_pos"), (nation, "player_nation")):
+            if value:
+                values = fuzzy_values(db, Players, field, value, threshold)
+                filters.append(getattr(Players, field).in_(values))
 
         if club_name:
-            active_club = db.query(Clubs).filter(Clubs.show == True).all()
-            club_id = None
-
-            for club in active_club:
-                if (
-                    fuzz.partial_ratio(club.club_name.lower(), club_name.lower())
-                    >= threshold
-                ):
-                    club_id = club.club_id
-                    break
-
-            if club_id:
-                matched_players = [
-                    player
-                    for player in matched_players
-                    if player.player_club == club_id
-                ]
-            else:
+            clubs = search(db, Clubs, "club_name", club_name, threshold, 1)
+            if not clubs:
+                if not db.query(Players).filter(Players.show == True).first():
+                    return {"status": "error", "message": "No players found"}
                 return {"status": "error", "message": "Cannot find club"}
+            filters.append(Players.player_club == clubs[0][0].club_id)
 
-        if position:
-            matched_players = [
-                player
-                for player in matched_players
-                if fuzz.partial_ratio(player.player_pos.lower(), position.lower())
-                >= threshold
-            ]
-
-        if nation:
-            matched_players = [
-                player
-                for player in matched_players
-                if fuzz.partial_ratio(player.player_nation.lower(), nation.lower())
-                >= threshold
-            ]
+        # ranked by name similarity, best `limit` first; otherwise pages of
+        # `limit` players by id
+        next_cursor = None
+        if full_name:
+            matched_players = search(
+                db,
+                Players,
+                "player_name",
+                full_name,
+                threshold,
+                limit or config.SEARCH_LIMIT,
+                filters,
+            )
+        else:
+            players, next_cursor = paginate(
+                db.query(Players).filter(*filters), (Players.player_id,), limit, cursor
+            )
+            matched_players = [(player, None) for player in players]
 
         if not matched_players:
+            if not db.query(Players).filter(Players.show == True).first():
+                return {"status": "error", "message": "No players found"}
             return {"status": "error", "message": "Cannot find players"}
 
-        res = [create_player_res_with_goals(db, player) for player in matched_players]
+        res = []
+        for player, score in matched_players:
+            player_res = create_player_res_with_goals(db, player)
+            if score is not None:
+                player_res["score"] = score
+            res.append(player_res)
 
-        return {"status": "success", "data": res}
+        return {"status": "success", "data": res, "next_cursor": next_cursor}
 
     except Exception as e:
         return {"status": "error", "message": f"Internal Server Error: {str(e)}"}
 
 
+# every visible player as an NDJSON or CSV download, see core/export.py
+@route.get("/export")
+def export_players(current_user: CurrentUser, format: str = "ndjson"):
+    return stream_query(visible_rows(Players), parse_format(format), "players")
+
+
 @route.put("/update-player")
-async def update_player(
+def update_player(
     playerID: int, player_update: PlayerUpdate, db: db_deps, current_user: CurrentUser
 ):
     try:
@@ -249,7 +230,7 @@ async def update_player(
 
 
 @route.put("/delete-player")
-async def delete_player(playerID: int, current_user: CurrentUser, db: db_deps):
+def delete_player(playerID: int, current_user: CurrentUser, db: db_deps):
     permission_result = get_user_permission(db, current_user, "manager")
 
     if permission_result["status"] == "error":
@@ -301,7 +282,7 @@ async def delete_player(playerID: int, current_user: CurrentUser, db: db_deps):
 
 
 @route.put("/restore-deleted-player")
-async def restore_deleted_player(
+def restore_deleted_player(
     player_id: int, current_user: CurrentUser, db: db_deps
 ):
     permission_result = get_user_permission(db, current_user, "manager")
@@ -345,7 +326,7 @@ async def restore_deleted_player(
 
 
 @route.delete("/permanently-delete-player")
-async def permanently_delete_player(
+def permanently_delete_player(
     player_id: int, db: db_deps, current_user: CurrentUser
 ):
     permission_result = get_user_permission(db, current_user, "manager")
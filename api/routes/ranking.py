@@ -1,10 +1,14 @@
 from datetime import datetime
 from fastapi import APIRouter, Depends, FastAPI, HTTPException
-from sqlalchemy import or_
+from sqlalchemy import insert, or_, update
 from sqlalchemy.orm import Session
 
 # from api.deps import get_db
-from core.db import db_deps
+from api.deps import CurrentUser
+from core.club_form import RECENT_MATCHES, get_club_form
+from core.db import db_deps, read_db_deps
+from core.export import parse_format, stream
+from core.standings import aggregate_rows, finalize, new_row, standings
 from schemas.db import Clubs, Matches, Params, Ranking
 from schemas.ranking import Criteria, RankingRes
 from utils import get_params, datetime_to_unix
@@ -12,34 +16,8 @@ from utils import get_params, datetime_to_unix
 route = APIRouter()
 
 
-def create_RankingRes(db: Session, r: Ranking) -> RankingRes:
-    next_match = (
-        db.query(Matches)
-        .filter(
-            Matches.show == True,
-            or_(Matches.team1 == r.club_id, Matches.team2 == r.club_id),
-            Matches.start > datetime_to_unix(datetime.now()),
-        )
-        .order_by(Matches.start.asc())
-        .first()
-    )
-    next_match_id = next_match.match_id if next_match else None
-
-    recent_matches = []
-    recents = (
-        db.query(Matches)
-        .filter(
-            Matches.show == True,
-            or_(Matches.team1 == r.club_id, Matches.team2 == r.club_id),
-            Matches.start < datetime_to_unix(datetime.now()),
-        )
-        .order_by(Matches.start.desc())
-        .all()
-    )
-    for recent in recents:
-        if len(recent_matches) > 5:
-            break
-        recent_matches.append(recent.match_id)
+def create_RankingRes(r: Ranking, form: dict) -> RankingRes:
+    club_form = form.get(r.club_id, {})
 
     return RankingRes(
         club_id=r.club_id,
@@ -51,14 +29,16 @@ def create_RankingRes(db: Session, r: Ranking) -> RankingRes:
         club_goals=r.club_goals,
         club_gconcede=0,
         club_gdif=r.club_gdif,
-        recent_matches=recent_matches,
-        next_match=next_match_id,
+        recent_matches=club_form.get("recent_matches", []),
+        next_match=club_form.get("next_match"),
         show=r.show,
     )
 
 
 @route.get("/ranking")
-async def ranking(db: db_deps, crit: Criteria, desc: bool = True):
+def ranking(
+    db: db_deps, crit: Criteria, desc: bool = True, recent: int = RECENT_MATCHES
+):
     try:
         if crit == "points":
             order = Ranking.club_points.desc() if desc else Ranking.club_points.asc()
@@ -78,7 +58,8 @@ async def ranking(db: db_deps, crit: Criteria, desc: bool = True):
             raise HTTPException(status_code=400, detail="Invalid criteria")
 
         rankings = db.query(Ranking).filter(Ranking.show == True).order_by(order).all()
-        res = [create_RankingRes(db, ranking) for ranking in rankings]
+        form = get_club_form(db, recent)
+        res = [create_RankingRes(ranking, form) for ranking in rankings]
 
         return {
             "status": "success",
@@ -95,7 +76,7 @@ async def ranking(db: db_deps, crit: Criteria, desc: bool = True):
 
 
 @route.get("/init-rank")
-async def init_rank(db: db_deps):
+def init_rank(db: db_deps):
     try:
         clubs = (
             db.query(Clubs)
@@ -131,80 +112,71 @@ async def init_rank(db: db_deps):
         }
 
 
-@route.put("/update-values")
-async def update_ranking_values(db: db_deps):
-    try:
-        matches = (
-            db.query(Matches).filter(Matches.show == True, Matches.finish != None).all()
-        )
-
-        rankings = db.query(Ranking).filter(Ranking.show == True).all()
-        for ranking in rankings:
-            ranking.away_goals = 0
-            ranking.club_points = 0
-            ranking.club_goals = 0
-            ranking.club_gdif = 0
-            ranking.club_win = 0
-            ranking.club_draw = 0
-            ranking.club_lost = 0
-            ranking.club_gconcede = 0
+RANKING_FIELDS = (
+    "away_goals",
+    "club_points",
+    "club_win",
+    "club_draw",
+    "club_lost",
+    "club_goals",
+    "club_gconcede",
+    "club_gdif",
+)
 
-        db.commit()
 
+@route.put("/update-values")
+def update_ranking_values(db: db_deps, dry_run: bool = False):
+    try:
         params = get_params(Params, db)
+        computed = aggregate_rows(db)
 
-        for match in matches:
-            rank_club1 = (
-                db.query(Ranking)
-                .filter(Ranking.show == True, Ranking.club_id == match.team1)
-                .first()
-            )
-            rank_club2 = (
-                db.query(Ranking)
-                .filter(Ranking.show == True, Ranking.club_id == match.team2)
-                .first()
-            )
-
-            rank_club1.club_goals = (rank_club1.club_goals or 0) + match.goal1
-            rank_club2.club_goals = (rank_club2.club_goals or 0) + match.goal2
-
-            rank_club2.away_goals = (rank_club2.away_goals or 0) + match.goal2
-
-            if match.goal1 == match.goal2:
-                rank_club1.club_draw = (rank_club1.club_draw or 0) + 1
-                rank_club2.club_draw = (rank_club2.club_draw or 0) + 1
-            elif match.goal1 < match.goal2:
-                rank_club1.club_lost = (rank_club1.club_lost or 0) + 1
-                rank_club2.club_win = (rank_club2.club_win or 0) + 1
-            else:
-                rank_club1.club_win = (rank_club1.club_win or 0) + 1
-                rank_club2.club_lost = (rank_club2.club_lost or 0) + 1
-
-            rank_club1.club_gconcede += match.goal2
-            rank_club2.club_gconcede += match.goal1
-
-            db.commit()
-
-            rank_club1.club_points = (
-                (rank_club1.club_win or 0) * params.points_win
-                + (rank_club1.club_draw or 0) * params.points_draw
-                + (rank_club1.club_lost or 0) * params.points_lose
-            )
-            rank_club2.club_points = (
-                (rank_club2.club_win or 0) * params.points_win
-                + (rank_club2.club_draw or 0) * params.points_draw
-                + (rank_club2.club_lost or 0) * params.points_lose
-            )
+        current = {r.club_id: r for r in db.query(Ranking).all()}
+        club_ids = {
+            club_id for (club_id,) in db.query(Clubs.club_id).filter(Clubs.show == True)
+        }
+        club_ids.update(r.club_id for r in current.values() if r.show)
+
+        diff = {}
+        updates = []
+        inserts = []
+        for club_id in sorted(club_ids):
+            values = finalize(computed.get(club_id) or new_row(club_id), params)
+            target = current.get(club_id)
+
+            if target is None:
+                inserts.append(values)
+                diff[club_id] = {f: [None, values[f]] for f in RANKING_FIELDS}
+                continue
+
+            changed = {
+                f: [getattr(target, f), values[f]]
+                for f in RANKING_FIELDS
+                if getattr(target, f) != values[f]
+            }
+            if changed:
+                updates.append({f: values[f] for f in ("club_id",) + RANKING_FIELDS})
+                diff[club_id] = changed
+
+        if dry_run:
+            return {
+                "status": "success",
+                "message": "Ranking values computed (dry run, nothing written)",
+                "data": diff,
+            }
 
-            rank_club1.club_gdif = (
-                (rank_club1.club_gdif or 0) + match.goal1 - match.goal2
-            )
-            rank_club2.club_gdif = (
-                (rank_club2.club_gdif or 0) + match.goal2 - match.goal1
-            )
+        if updates:
+            db.execute(update(Ranking), updates)
+        if inserts:
+            db.execute(insert(Ranking), inserts)
+        db.commit()
 
-        return {"status": "success", "message": "Ranking values updated successfully"}
+        return {
+            "status": "success",
+            "message": "Ranking values updated successfully",
+            "data": diff,
+        }
     except Exception as e:
+        db.rollback()
         return {
             "status": "error",
             "message": "An error occurred while updating ranking values",
@@ -271,98 +243,12 @@ async def update_ranking_values(db: db_deps):
 
 
 @route.get("/get")
-async def rank_baotg(db: db_deps):
+def rank_baotg(db: read_db_deps, as_of: int = None, round: int = None):
     try:
-        priority = db.query(Params).first().priority.split(";")
-        matches = db.query(Matches).filter(Matches.show == True).all()
-        clubs = db.query(Clubs).filter(Clubs.show == True).all()
-        results = {}
-        params = get_params(Params, db)
-
-        for club in clubs:
-            results[club.club_id] = {
-                "club_id": club.club_id,
-                "away_goals": 0,
-                "club_points": 0,
-                "club_win": 0,
-                "club_draw": 0,
-                "club_lost": 0,
-                "club_goals": 0,
-                "club_gconcede": 0,
-                "club_gdif": 0,
-                "show": True,
-            }
-
-        for match in matches:
-            results[match.team1]["club_goals"] += match.goal1
-            results[match.team2]["club_goals"] += match.goal2
-            results[match.team2]["away_goals"] += match.goal2
-            results[match.team1]["club_gconcede"] += match.goal2
-            results[match.team2]["club_gconcede"] += match.goal1
-
-            if match.goal1 == match.goal2:
-                results[match.team1]["club_draw"] += 1
-                results[match.team2]["club_draw"] += 1
-            elif match.goal1 < match.goal2:
-                results[match.team1]["club_lost"] += 1
-                results[match.team2]["club_win"] += 1
-            else:
-                results[match.team1]["club_win"] += 1
-                results[match.team2]["club_lost"] += 1
-
-        for club in clubs:
-            results[club.club_id]["club_points"] = (
-                results[club.club_id]["club_win"] * params.points_win
-                + results[club.club_id]["club_draw"] * params.points_draw
-                + results[club.club_id]["club_lost"] * params.points_lose
-            )
-            results[club.club_id]["club_gdif"] = (
-                results[club.club_id]["club_goals"]
-                - results[club.club_id]["club_gconcede"]
-            )
-
-        index = priority.index("h")
-
-        mapping_priority = {
-            "p": "club_points",
-            "d": "club_gdif",
-            "g": "club_goals",
-        }
-
-        first_priority = priority[:index]
-        second_priority = priority[index + 1 :]
-
-        results = sorted(
-            results.values(),
-            key=lambda x: tuple([x[mapping_priority[p]] for p in first_priority]),
-            reverse=True,
-        )
-
-        print(results[:10])
-
-        temp = []
-        groups = []
-
-        for i in range(len(results)):
-            if i == 0 or all(
-                results[i][mapping_priority[p]] == results[i - 1][mapping_priority[p]]
-                for p in first_priority
-            ):
-                temp.append(results[i])
-            else:
-                groups.append(temp)
-                temp = [results[i]]
-
-        if temp:
-            groups.append(temp)
-
-        for group in groups:
-            group.sort(
-                key=lambda x: tuple([x[mapping_priority[p]] for p in second_priority]),
-                reverse=True,
-            )
-
-        sorted_results = [item for sublist in groups for item in sublist]
+        if as_of is None and round is None:
+            sorted_results = standings.table(db)
+        else:
+            sorted_results = standings.table_as_of(db, as_of, round)
 
         return {
             "status": "success",
@@ -374,3 +260,23 @@ async def rank_baotg(db: db_deps):
             "status": "error",
             "message": "An error occurred while retrieving the ranking",
         }
+
+
+# the current table, or the one as of a time/round, as an NDJSON or CSV
+# download in ranking order
+@route.get("/export")
+def export_ranking(
+    db: read_db_deps,
+    current_user: CurrentUser,
+    format: str = "ndjson",
+    as_of: int = None,
+    round: int = None,
+):
+    format = parse_format(format)
+    if as_of is None and round is None:
+        rows = standings.table(db)
+    else:
+        rows = standings.table_as_of(db, as_of, round)
+
+    fields = list(rows[0]) if rows else list(new_row(0))
+    return stream(rows, fields, format, "ranking")
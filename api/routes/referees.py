@@ -1,70 +1,31 @@
 from datetime import date
 
 from fastapi import APIRouter, Depends, FastAPI, HTTPException
-from fuzzywuzzy import fuzz
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy import func
 
 from api.deps import CurrentUser, List
 from core.db import db as code_db
 from core.db import db_deps
+from core.authz import check_permission
+from core.config import config
+from core.pagination import paginate
+from core.search import search
 from schemas.db import Referees, Clubs, Players, Users
 from schemas.referees import RefCreate, RefShow, RefUpdate
 
 route = APIRouter()
 
 
-def get_user_permission(db: db_deps, current_user: CurrentUser, role: str):
-    if current_user is None:
-        raise HTTPException(
-            status_code=401,
-            detail={"status": "error", "message": "Authentication Failed"},
-        )
-
-    user_role = (
-        db.query(Users).filter(Users.user_id == current_user["user_id"]).first().role  # type: ignore
-    )
-
-    # check permission of user_role
-    if role == "manager":
-        # check if user is deleted or not
-        if (
-            not db.query(Users)
-            .filter(Users.user_id == current_user["user_id"])
-            .first()
-            .show  # type: ignore
-        ):
-            raise HTTPException(
-                status_code=401,
-                detail={
-                    "status": "error",
-                    "message": "Your account is no longer active!",
-                },
-            )
-
-        return True
-    elif role == "admin" and user_role != role:
-        raise HTTPException(
-            status_code=401,
-            detail={
-                "status": "error",
-                "message": "You don't have permission to do this action!",
-            },
-        )
-
-    return True
-
-
 @route.post("/add-refs")
-async def add_refs(ref: RefCreate, db: db_deps):  # current_user: CurrentUser):
+def add_refs(ref: RefCreate, db: db_deps):  # current_user: CurrentUser):
     try:
-        # hasPermission = get_user_permission(current_user, db, "admin")
+        # hasPermission = check_permission(db, current_user, "admin")
         newRefDict = ref.dict()
         for key, value in newRefDict.items():
             if value == "string":
                 return {"status": "error", "message": f"{key} is required."}
 
-        count = db.query(func.max(Referees.ref_id)).scalar()
-        newRefDict["ref_id"] = (count or 0) + 1
         new_db_ref = Referees(**newRefDict)
 
         db.add(new_db_ref)
@@ -89,13 +50,15 @@ async def add_refs(ref: RefCreate, db: db_deps):  # current_user: CurrentUser):
 
 
 @route.get("/get-ref")
-async def get_ref(ref_name: str, db: db_deps, threshold: int = 80):
+def get_ref(
+    ref_name: str, db: db_deps, threshold: int = 80, limit: int = config.SEARCH_LIMIT
+):
     try:
-        refs = db.query(Referees).filter(Referees.show == True).all()
         matched_refs = [
-            ref
-            for ref in refs
-            if fuzz.partial_ratio(ref.ref_name.lower(), ref_name.lower()) >= threshold
+            {**jsonable_encoder(ref), "score": score}
+            for ref, score in search(
+                db, Referees, "ref_name", ref_name, threshold, limit
+            )
         ]
 
         if not matched_refs:
@@ -116,10 +79,15 @@ async def get_ref(ref_name: str, db: db_deps, threshold: int = 80):
 
 
 @route.get("/get-all")
-async def get_all_refs(db: db_deps):
+def get_all_refs(db: db_deps, limit: int = None, cursor: str = None):
     try:
-        refs = db.query(Referees).filter(Referees.show == True).all()
-        if not refs:
+        refs, next_cursor = paginate(
+            db.query(Referees).filter(Referees.show == True),
+            (Referees.ref_id,),
+            limit,
+            cursor,
+        )
+        if not refs and not cursor:
             raise HTTPException(
                 status_code=204, detail={"status": "error", "message": "No refs found"}
             )
@@ -134,15 +102,16 @@ async def get_all_refs(db: db_deps):
         "status": "success",
         "message": "All referees fetched successfully",
         "data": refs,
+        "next_cursor": next_cursor,
     }
 
 
 @route.put("/update-ref")
-async def update_ref(
+def update_ref(
     ref_id: int, ref_update: RefUpdate, db: db_deps
 ):  # current_user: CurrentUser):
     try:
-        # hasPermission = get_user_permission(current_user, db, "manager")
+        # hasPermission = check_permission(db, current_user, "manager")
         target = db.query(Referees).filter(Referees.ref_id == ref_id).first()
         update_info = ref_update.dict(exclude_unset=True)
         for key, value in update_info.items():
@@ -165,8 +134,8 @@ async def update_ref(
 
 
 @route.put("/delete-ref")
-async def delete_ref(ref_id: int, current_user: CurrentUser, db: db_deps):
-    hasPermission = get_user_permission(db, current_user, "admin")
+def delete_ref(ref_id: int, current_user: CurrentUser, db: db_deps):
+    hasPermission = check_permission(db, current_user, "admin")
 
     try:
         target = db.query(Referees).filter(Referees.ref_id == ref_id).first()
@@ -198,8 +167,8 @@ async def delete_ref(ref_id: int, current_user: CurrentUser, db: db_deps):
 
 
 @route.put("/restore-deleted-ref")
-async def restore_deleted_ref(ref_id: int, current_user: CurrentUser, db: db_deps):
-    hasPermission = get_user_permission(db, current_user, "manager")
+def restore_deleted_ref(ref_id: int, current_user: CurrentUser, db: db_deps):
+    hasPermission = check_permission(db, current_user, "manager")
     try:
         target = db.query(Referees).filter(Referees.ref_id == ref_id).first()
         if target.show != True:
@@ -216,8 +185,8 @@ async def restore_deleted_ref(ref_id: int, current_user: CurrentUser, db: db_dep
 
 
 @route.delete("/permanently-delete-ref")
-async def permanently_delete_ref(ref_id: int, db: db_deps, current_user: CurrentUser):
-    hasPermission = get_user_permission(db, current_user, "manager")
+def permanently_delete_ref(ref_id: int, db: db_deps, current_user: CurrentUser):
+    hasPermission = check_permission(db, current_user, "manager")
 
     try:
         target = db.query(Referees).filter(Referees.ref_id == ref_id).first()
@@ -6,6 +6,7 @@ from fuzzywuzzy import fuzz
 
 from api.deps import CurrentUser
 from core.db import db_deps
+from core.pagination import paginate
 from schemas.db import Clubs, Users, Matches, Stadiums
 from schemas.stadiums import StadiumAdd, List
 from utils import (
@@ -25,13 +26,20 @@ def create_success_response(message: str, data=None):
 
 
 @route.get("/get-all-stadiums")
-async def get_all_stadiums(db: db_deps):
-    query = db.query(Stadiums).filter(Stadiums.show == True).all()
-    return create_success_response("Stadiums fetched successfully", query)
+def get_all_stadiums(db: db_deps, limit: int = None, cursor: str = None):
+    query, next_cursor = paginate(
+        db.query(Stadiums).filter(Stadiums.show == True),
+        (Stadiums.std_id,),
+        limit,
+        cursor,
+    )
+    res = create_success_response("Stadiums fetched successfully", query)
+    res["next_cursor"] = next_cursor
+    return res
 
 
 @route.post("/add-stadium")
-async def add_stadium(
+def add_stadium(
     db: db_deps,
     current_user: CurrentUser,
     new: StadiumAdd,
@@ -59,10 +67,7 @@ async def add_stadium(
         return create_success_response("Stadium restored successfully", dup)
 
     # no dup -> add
-    max_id = db.query(func.max(Stadiums.std_id)).scalar()
-    new_db_std = Stadiums(
-        std_id=(max_id or 0) + 1, std_name=new.std_name, cap=new.cap, show=True
-    )
+    new_db_std = Stadiums(std_name=new.std_name, cap=new.cap, show=True)
     db.add(new_db_std)
     db.commit()
     db.refresh(new_db_std)
@@ -70,7 +75,7 @@ async def add_stadium(
 
 
 @route.put("/delete-stadium")
-async def delete_stadium(
+def delete_stadium(
     db: db_deps,
     current_user: CurrentUser,
     std_id: int,
@@ -111,13 +116,13 @@ async def delete_stadium(
 
 
 @route.get("/get-deleted-stadiums")
-async def get_deleted_stadiums(db: db_deps):
+def get_deleted_stadiums(db: db_deps):
     query = db.query(Stadiums).filter(Stadiums.show == False).all()
     return create_success_response("Deleted stadiums fetched successfully", query)
 
 
 @route.put("/restore-stadium")
-async def restore_stadium(
+def restore_stadium(
     db: db_deps,
     current_user: CurrentUser,
     std_id: int,
@@ -144,7 +149,7 @@ async def restore_stadium(
 
 
 @route.get("/matches-of-stadium")
-async def get_matches_of_stadium(db: db_deps, std_id: int):
+def get_matches_of_stadium(db: db_deps, std_id: int):
     # find matches
     matches = (
         db.query(Matches).filter(Matches.show == True, Matches.stadium == std_id).all()
@@ -1,13 +1,18 @@
 from datetime import date, datetime
 
 from core.db import db_deps, db, get_params
+from core.authz import DELETED, bump_token_version, check_permission, invalidate_user
+from core.config import config
+from core.hashing import HashingBusy
+from core.pagination import paginate
+from core.search import search
 from crud import create_user, get_info_user
 from fastapi import APIRouter, HTTPException, Depends
 from schemas.db import Users, Params
 from schemas.users import UserCreateBase, UserReg, UserUpdate
 from sqlalchemy import func
 
-from api.deps import List, CurrentUser, get_password_hash, fuzz
+from api.deps import List, CurrentUser, get_password_hash
 from utils import unix_to_date, date_to_unix
 
 route = APIRouter()
@@ -27,50 +32,11 @@ def create_user_res(user):
     return res
 
 
-def get_user_permission(db: db_deps, current_user: CurrentUser, role: str):
-    if current_user is None:
-        raise HTTPException(
-            status_code=401,
-            detail={"status": "error", "message": "Authentication Failed"},
-        )
-
-    user_role = (
-        db.query(Users).filter(Users.user_id == current_user["user_id"]).first().role
-    )
-
-    if role == "manager":
-        if (
-            not db.query(Users)
-            .filter(Users.user_id == current_user["user_id"])
-            .first()
-            .show
-        ):
-            raise HTTPException(
-                status_code=401,
-                detail={
-                    "status": "error",
-                    "message": "Your account is no longer active!",
-                },
-            )
-
-        return True
-    elif role == "admin" and user_role != role:
-        raise HTTPException(
-            status_code=401,
-            detail={
-                "status": "error",
-                "message": "You don't have permission to do this action!",
-            },
-        )
-
-    return True
-
-
 @route.post("/create-user")
-async def create_user_route(
+def create_user_route(
     db: db_deps, current_user: CurrentUser, new_user: UserCreateBase
 ):
-    hasPermission = get_user_permission(db, current_user, "admin")
+    hasPermission = check_permission(db, current_user, "admin")
 
     try:
         user = create_user(db, new_user)
@@ -83,24 +49,30 @@ async def create_user_route(
             "message": "User created successfully!",
             "data": user,
         }
+    except HashingBusy:
+        raise
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 
 @route.get("/")
-async def get_all_users(current_user: CurrentUser, db: db_deps):
+def get_all_users(
+    current_user: CurrentUser, db: db_deps, limit: int = None, cursor: str = None
+):
     try:
-        hasPermission = get_user_permission(db, current_user, "admin")
-        db_users = db.query(Users).all()
+        hasPermission = check_permission(db, current_user, "admin")
+        db_users, next_cursor = paginate(
+            db.query(Users), (Users.user_id,), limit, cursor
+        )
 
         res = [create_user_res(user) for user in db_users]
-        return {"status": "success", "data": res}
+        return {"status": "success", "data": res, "next_cursor": next_cursor}
     except Exception as e:
         return {"status": "error", "message": f"Internal server error: {str(e)}"}
 
 
 @route.get("/me")
-async def get_user_info(current_user: CurrentUser, db: db_deps):
+def get_user_info(current_user: CurrentUser, db: db_deps):
     try:
         res = get_info_user(db, current_user)
 
@@ -115,8 +87,8 @@ async def get_user_info(current_user: CurrentUser, db: db_deps):
 
 # GET existing users (not deleted)
 @route.get("/get-activated-users")
-async def get_activated_users(current_user: CurrentUser, db: db_deps):
-    hasPermission = get_user_permission(db, current_user, "admin")
+def get_activated_users(current_user: CurrentUser, db: db_deps):
+    hasPermission = check_permission(db, current_user, "admin")
 
     db_users = db.query(Users).filter(Users.show == True).all()
     if db_users == None:
@@ -127,8 +99,8 @@ async def get_activated_users(current_user: CurrentUser, db: db_deps):
 
 # GET deleted users
 @route.get("/get-inactivated-users")
-async def get_inactivated_users(current_user: CurrentUser, db: db_deps):
-    hasPermission = get_user_permission(db, current_user, "admin")
+def get_inactivated_users(current_user: CurrentUser, db: db_deps):
+    hasPermission = check_permission(db, current_user, "admin")
 
     db_users = db.query(Users).filter(Users.show == False).all()
     if db_users == None:
@@ -139,8 +111,8 @@ async def get_inactivated_users(current_user: CurrentUser, db: db_deps):
 
 # DELETE users (using put like update)
 @route.put("/delete/{target_user_id}")
-async def delete_user(target_user_id: int, current_user: CurrentUser, db: db_deps):
-    hasPermission = get_user_permission(db, current_user, "admin")
+def delete_user(target_user_id: int, current_user: CurrentUser, db: db_deps):
+    hasPermission = check_permission(db, current_user, "admin")
     try:
         db_user = db.query(Users).filter(Users.user_id == target_user_id).first()
 
@@ -152,7 +124,9 @@ async def delete_user(target_user_id: int, current_user: CurrentUser, db: db_dep
 
         if db_user.show == True:
             db_user.show = False
+            version = bump_token_version(db_user)
             db.commit()
+            invalidate_user(target_user_id, version)
             return {
                 "status": "success",
                 "message": f"Deleted user with id: {target_user_id}",
@@ -169,13 +143,14 @@ async def delete_user(target_user_id: int, current_user: CurrentUser, db: db_dep
 
 # Restore deleted users
 @route.put("/restore-deleted-user/{user_id}")
-async def restore_deleted_user(user_id: int, current_user: CurrentUser, db: db_deps):
-    hasPermission = get_user_permission(db, current_user, "admin")
+def restore_deleted_user(user_id: int, current_user: CurrentUser, db: db_deps):
+    hasPermission = check_permission(db, current_user, "admin")
     try:
         db_user = db.query(Users).filter(Users.user_id == user_id).first()
         if db_user.show != True:
             db_user.show = True
             db.commit()
+            invalidate_user(user_id)
             return {"status": "success", "message": f"Restored user with id: {user_id}"}
         else:
             return {"status": "error", "message": f"Can't find user with id: {user_id}"}
@@ -185,13 +160,14 @@ async def restore_deleted_user(user_id: int, current_user: CurrentUser, db: db_d
 
 # Permanently delete user
 @route.delete("/permanently-delete/{user_id}")
-async def permanently_delete_user(user_id: int, db: db_deps, current_user: CurrentUser):
-    hasPermission = get_user_permission(db, current_user, "admin")
+def permanently_delete_user(user_id: int, db: db_deps, current_user: CurrentUser):
+    hasPermission = check_permission(db, current_user, "admin")
 
     target = db.query(Users).filter(Users.user_id == user_id).first()
 
     db.delete(target)
     db.commit()
+    invalidate_user(user_id, DELETED)
     return {
         "status": "success",
         "message": f"Delete user with id {user_id} successfully !",
@@ -200,15 +176,16 @@ async def permanently_delete_user(user_id: int, db: db_deps, current_user: Curre
 
 # Update users
 @route.put("/update-user-info/{user_id}")
-async def update_user_info(
+def update_user_info(
     user_id: int, new_info: UserUpdate, current_user: CurrentUser, db: db_deps
 ):
-    hasPermission = get_user_permission(db, current_user, "admin")
+    hasPermission = check_permission(db, current_user, "admin")
     try:
         target = db.query(Users).filter(Users.user_id == user_id).first()
 
         update_info = new_info.dict(exclude_unset=True)
 
+        changed = set()
         for key, value in update_info.items():
             print(key, value)
 
@@ -222,9 +199,17 @@ async def update_user_info(
             if key == "password":
                 value = get_password_hash(value)
 
+            if getattr(target, key) != value:
+                changed.add(key)
             setattr(target, key, value)
 
+        # a new role or password logs the user out everywhere
+        version = None
+        if "role" in changed or "password" in changed:
+            version = bump_token_version(target)
+
         db.commit()
+        invalidate_user(user_id, version)
         db.refresh(target)
 
         return {
@@ -239,6 +224,8 @@ async def update_user_info(
                 "user_mail": target.user_mail,
             },
         }
+    except HashingBusy:
+        raise
     except Exception as e:
         return {"status": "error", "message": f"Internal Server Error: {str(e)}"}
 
@@ -246,24 +233,24 @@ async def update_user_info(
 # SEARCH
 # search by name
 @route.get("/search-by-name")
-async def search_user_by_name(
-    full_name: str, db: db_deps, current_user: CurrentUser, threshold: int = 80
+def search_user_by_name(
+    full_name: str,
+    db: db_deps,
+    current_user: CurrentUser,
+    threshold: int = 80,
+    limit: int = config.SEARCH_LIMIT,
 ):
     try:
-        activated_users = db.query(Users).filter(Users.show == True).all()
-        matched_users = (
-            user
-            for user in activated_users
-            if fuzz.partial_ratio(user.full_name.lower(), full_name.lower())
-            >= threshold
-        )
+        matched_users = search(db, Users, "full_name", full_name, threshold, limit)
         if not matched_users:
             return {
                 "status": "error",
                 "message": f"Can't find any users match the name: {full_name}",
             }
 
-        res = [create_user_res(user) for user in matched_users]
+        res = [
+            {**create_user_res(user), "score": score} for user, score in matched_users
+        ]
         return {"status": "success", "data": res}
     except Exception as e:
         return {"status": "error", "message": f"Internal Server Error: {str(e)}"}
@@ -271,22 +258,23 @@ async def search_user_by_name(
 
 # search by nation
 @route.get("/search-by-nation")
-async def search_user_by_nation(
-    nation: str, db: db_deps, current_user: CurrentUser, threshold: int = 80
+def search_user_by_nation(
+    nation: str,
+    db: db_deps,
+    current_user: CurrentUser,
+    threshold: int = 80,
+    limit: int = config.SEARCH_LIMIT,
 ):
     try:
-        activated_users = db.query(Users).filter(Users.show == True).all()
-        matched_users = (
-            user
-            for user in activated_users
-            if fuzz.partial_ratio(user.user_nation.lower(), nation.lower()) >= threshold
-        )
+        matched_users = search(db, Users, "user_nation", nation, threshold, limit)
         if not matched_users:
             return {
                 "status": "error",
                 "message": f"Can't find any users match the nation: {nation}",
             }
-        res = [create_user_res(user) for user in matched_users]
+        res = [
+            {**create_user_res(user), "score": score} for user, score in matched_users
+        ]
         return {"status": "success", "data": res}
     except Exception as e:
         return {"status": "error", "message": f"Internal Server Error: {str(e)}"}
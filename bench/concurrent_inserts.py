@@ -0,0 +1,85 @@
+"""Concurrent inserts must never hand out the same id twice.
+
+Start the API with several workers first, e.g.
+
+    uvicorn main:app --port 3000 --workers 4
+
+then
+
+    python bench/concurrent_inserts.py -c 64 -n 2000
+
+Fires `-n` POST /referees/add-refs from `-c` concurrent clients and checks
+that every insert succeeded with an id of its own. Exits non-zero on a
+failed insert or a duplicate id. The referees are left in the database.
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+
+async def worker(client, url, run, count, ids, failures):
+    for i in range(count):
+        ref = {
+            "ref_name": f"Bench {run} {i}",
+            "ref_bday": 0,
+            "ref_nation": "VIE",
+            "ref_mail": "bench@example.com",
+        }
+        try:
+            response = await client.post(url, json=ref)
+            body = response.json()
+        except httpx.HTTPError as e:
+            failures.append(repr(e))
+            continue
+
+        if response.status_code == 200 and body.get("status") == "success":
+            ids.append(body["data"]["ref_id"])
+        else:
+            failures.append(body)
+
+
+async def main(args):
+    url = args.url.rstrip("/") + "/api/v1/referees/add-refs"
+    ids = []
+    failures = []
+
+    per_client = [args.requests // args.concurrency] * args.concurrency
+    for i in range(args.requests % args.concurrency):
+        per_client[i] += 1
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(
+                worker(client, url, f"{uuid.uuid4().hex[:8]}-{n}", count, ids, failures)
+                for n, count in enumerate(per_client)
+            )
+        )
+        elapsed = time.perf_counter() - start
+
+    duplicates = [ref_id for ref_id, n in Counter(ids).items() if n > 1]
+
+    print(f"inserts:     {len(ids)} in {elapsed:.2f}s ({len(ids) / elapsed:.0f}/s)")
+    print(f"failures:    {len(failures)}")
+    for failure in failures[:5]:
+        print(f"             {failure}")
+    print(f"duplicates:  {len(duplicates)}")
+
+    return 1 if failures or duplicates else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", type=str, default="http://127.0.0.1:3000")
+    parser.add_argument("-c", "--concurrency", type=int, default=32)
+    parser.add_argument("-n", "--requests", type=int, default=1000)
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(main(args)))
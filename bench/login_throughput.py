@@ -0,0 +1,76 @@
+"""Login throughput under concurrent clients.
+
+Start the API first (python main.py), then for example:
+
+    python bench/login_throughput.py --user admin --password admin -c 32 -n 500
+
+Reports requests/s, latency percentiles and the status codes seen; 429s
+are logins turned away by the hashing pool (HASH_WORKERS/HASH_MAX_PENDING).
+"""
+
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+
+
+async def worker(client, url, form, count, latencies, statuses):
+    for _ in range(count):
+        start = time.perf_counter()
+        response = await client.post(url, data=form)
+        latencies.append(time.perf_counter() - start)
+
+        status = response.status_code
+        if status == 200 and "access_token" not in response.json():
+            status = "200 (login failed)"
+        statuses[status] += 1
+
+
+async def main(args):
+    url = args.url.rstrip("/") + "/api/v1/auth/token"
+    form = {"username": args.user, "password": args.password}
+    latencies = []
+    statuses = Counter()
+
+    per_client = [args.requests // args.concurrency] * args.concurrency
+    for i in range(args.requests % args.concurrency):
+        per_client[i] += 1
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(
+                worker(client, url, form, count, latencies, statuses)
+                for count in per_client
+            )
+        )
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(p):
+        return 1000 * latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    print(f"clients:     {args.concurrency}")
+    print(f"requests:    {len(latencies)} in {elapsed:.2f}s")
+    print(f"throughput:  {len(latencies) / elapsed:.1f} logins/s")
+    print(
+        f"latency ms:  p50 {percentile(0.50):.0f}  p95 {percentile(0.95):.0f}"
+        f"  p99 {percentile(0.99):.0f}  max {1000 * latencies[-1]:.0f}"
+    )
+    print(f"statuses:    {dict(statuses)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", type=str, default="http://127.0.0.1:3000")
+    parser.add_argument("--user", type=str, default="admin")
+    parser.add_argument("--password", type=str, default="admin")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-n", "--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
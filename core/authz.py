@@ -0,0 +1,183 @@
+import threading
+from typing import NamedTuple
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from core.cache import TTLCache
+from core.config import config
+from core.db import db as database
+from core.db import notifier
+from schemas.db import Users
+
+USER_ACCESS_CHANNEL = "user_access_changed"
+
+# token version of a hard-deleted user, newer than any token
+DELETED = float("inf")
+
+
+class UserAccess(NamedTuple):
+    user_id: int
+    role: str
+    show: bool
+    version: int = 0
+
+
+# user_id -> UserAccess
+access_cache = TTLCache(config.AUTHZ_CACHE_SIZE, config.AUTHZ_CACHE_TTL)
+
+# Revocation list: user_id -> current Users.token_version. A token whose
+# "ver" claim is older has been revoked. Loaded in one query on first use
+# and kept current by the notifier.
+_versions = None
+_versions_lock = threading.Lock()
+
+
+def _token_versions() -> dict:
+    global _versions
+    versions = _versions
+    if versions is None:
+        with _versions_lock:
+            if _versions is None:
+                with database.session() as session:
+                    _versions = dict(
+                        session.query(Users.user_id, Users.token_version).all()
+                    )
+            versions = _versions
+    return versions
+
+
+def token_revoked(user_id: int, version) -> bool:
+    if version is None:
+        return False
+    current = _token_versions().get(user_id)
+    return current is not None and version < current
+
+
+# role, active state and token version of a user, None if the user does not
+# exist
+def get_user_access(db: Session, user_id: int):
+    access = access_cache.get(user_id)
+    if access is not None:
+        return access
+
+    row = (
+        db.query(Users.role, Users.show, Users.token_version)
+        .filter(Users.user_id == user_id)
+        .first()
+    )
+    if row is None:
+        return None
+
+    access = UserAccess(user_id, row.role, row.show, row.token_version or 0)
+    access_cache.set(user_id, access)
+    # users created after the revocation list was loaded
+    _token_versions().setdefault(user_id, access.version)
+    return access
+
+
+# access of the authenticated user, None if the token no longer is valid.
+#
+# Tokens carrying role/active/version claims of a user on the revocation
+# list are authorized from the claims alone, without a query. Older tokens
+# and users the list does not know yet go through get_user_access().
+def get_principal_access(db: Session, current_user: dict):
+    user_id = current_user["user_id"]
+    version = current_user.get("version")
+
+    if (
+        current_user.get("role") is not None
+        and version is not None
+        and _token_versions().get(user_id) == version
+    ):
+        return UserAccess(
+            user_id, current_user["role"], current_user["active"], version
+        )
+
+    access = get_user_access(db, user_id)
+    if access is not None and version is not None and version < access.version:
+        return None
+    return access
+
+
+# access of the authenticated user, 401 if there is none
+def resolve_user(db: Session, current_user: dict) -> UserAccess:
+    access = None
+    if current_user is not None:
+        access = get_principal_access(db, current_user)
+    if access is None:
+        raise HTTPException(
+            status_code=401,
+            detail={"status": "error", "message": "Authentication Failed"},
+        )
+    return access
+
+
+# role="manager" requires an active account, role="admin" the admin role
+def check_permission(db: Session, current_user: dict, role: str):
+    access = resolve_user(db, current_user)
+
+    if role == "manager":
+        if not access.show:
+            raise HTTPException(
+                status_code=401,
+                detail={
+                    "status": "error",
+                    "message": "Your account is no longer active!",
+                },
+            )
+    elif role == "admin" and access.role != role:
+        raise HTTPException(
+            status_code=401,
+            detail={
+                "status": "error",
+                "message": "You don't have permission to do this action!",
+            },
+        )
+
+    return True
+
+
+# Revoke every token issued to the user so far. Call before committing the
+# change to the user, then invalidate_user() with the returned version.
+def bump_token_version(user: Users) -> int:
+    user.token_version = (user.token_version or 0) + 1
+    return user.token_version
+
+
+# call after committing a change to a user's role, active state or token
+# version; version=DELETED after removing the user
+def invalidate_user(user_id: int, version=None):
+    _apply_change(user_id, version)
+    payload = str(user_id)
+    if version is not None:
+        payload += ":" + ("deleted" if version == DELETED else str(version))
+    notifier.publish(USER_ACCESS_CHANNEL, payload)
+
+
+def _apply_change(user_id: int, version):
+    access_cache.pop(user_id)
+    if version is not None:
+        versions = _token_versions()
+        versions[user_id] = max(versions.get(user_id, 0), version)
+
+
+def _on_user_changed(payload):
+    global _versions
+    user_id, _, version = (payload or "").partition(":")
+    if not user_id.isdigit():
+        # missed notifications, reload everything on next use
+        access_cache.clear()
+        _versions = None
+        return
+
+    if version == "deleted":
+        version = DELETED
+    elif version.isdigit():
+        version = int(version)
+    else:
+        version = None
+    _apply_change(int(user_id), version)
+
+
+notifier.subscribe(USER_ACCESS_CHANNEL, _on_user_changed)
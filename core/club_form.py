@@ -0,0 +1,67 @@
+from datetime import datetime
+
+from sqlalchemy import and_, case, func, or_, select, union_all
+from sqlalchemy.orm import Session
+
+from schemas.db import Matches
+
+# how many past matches are reported per club
+RECENT_MATCHES = 6
+
+
+# next match and last `recent` matches of every club, in a single query:
+# {club_id: {"next_match": id | None, "recent_matches": [id, ...]}}
+def get_club_form(db: Session, recent: int = RECENT_MATCHES) -> dict:
+    now = int(datetime.now().timestamp())
+
+    # one row per (club, match) from both the home and the away side
+    sides = union_all(
+        select(Matches.team1.label("club_id"), Matches.match_id, Matches.start).where(
+            Matches.show == True
+        ),
+        select(Matches.team2.label("club_id"), Matches.match_id, Matches.start).where(
+            Matches.show == True
+        ),
+    ).subquery()
+
+    upcoming = sides.c.start > now
+    ranked = (
+        select(
+            sides.c.club_id,
+            sides.c.match_id,
+            upcoming.label("upcoming"),
+            func.row_number()
+            .over(
+                partition_by=(sides.c.club_id, upcoming),
+                # earliest first for upcoming matches, latest first for past ones
+                order_by=(
+                    case((upcoming, sides.c.start), else_=-sides.c.start),
+                    sides.c.match_id,
+                ),
+            )
+            .label("rn"),
+        )
+        .where(sides.c.start != now)
+        .subquery()
+    )
+
+    rows = db.execute(
+        select(ranked.c.club_id, ranked.c.match_id, ranked.c.upcoming)
+        .where(
+            or_(
+                and_(ranked.c.upcoming, ranked.c.rn == 1),
+                and_(~ranked.c.upcoming, ranked.c.rn <= recent),
+            )
+        )
+        .order_by(ranked.c.club_id, ranked.c.rn)
+    ).all()
+
+    form = {}
+    for club_id, match_id, is_upcoming in rows:
+        entry = form.setdefault(club_id, {"next_match": None, "recent_matches": []})
+        if is_upcoming:
+            entry["next_match"] = match_id
+        else:
+            entry["recent_matches"].append(match_id)
+
+    return form
@@ -6,12 +6,66 @@ class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=find_dotenv())
 
     SQL_INIT_PATH: str
+    MIGRATIONS_PATH: str = "./data/migrations"
 
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
     POSTGRES_SERVER: str
     POSTGRES_PORT: str
     POSTGRES_DB: str
+    # SQLAlchemy URL of the primary, overrides the POSTGRES_* settings
+    DATABASE_URL: str = ""
+    DB_POOL_SIZE: int = 100
+    DB_MAX_OVERFLOW: int = 10
+    # most pooled connections one request holds at once (its session plus a
+    # nested checkout, e.g. the first load of the token versions)
+    DB_CONNECTIONS_PER_REQUEST: int = 2
+    # comma separated SQLAlchemy URLs of read replicas, empty = primary only
+    POSTGRES_REPLICA_URLS: str = ""
+    # seconds after a write during which reads stay on the primary
+    REPLICA_MAX_LAG: float = 1.0
+    # seconds before the fuzzy name indexes reload from the database
+    FUZZY_INDEX_TTL: float = 300
+    # default number of results of the name search endpoints
+    SEARCH_LIMIT: int = 20
+    # default and largest page of the list endpoints, see core/pagination.py
+    PAGE_SIZE: int = 100
+    MAX_PAGE_SIZE: int = 1000
+    # rows fetched and sent at a time by the export endpoints
+    EXPORT_CHUNK_SIZE: int = 1000
+    # exports streaming at once per worker, each holds a pooled connection
+    # until its last row is sent
+    EXPORT_MAX_CONCURRENT: int = 4
+    # most events accepted by one /events/add-batch call
+    EVENT_BATCH_SIZE: int = 500
+    # frames a live score subscriber may fall behind before it has to
+    # resync, and seconds between keep-alive comments
+    LIVE_BUFFER_SIZE: int = 64
+    LIVE_KEEPALIVE: float = 15
+
+    # role/active state of authenticated users, see core/authz.py
+    AUTHZ_CACHE_SIZE: int = 10000
+    AUTHZ_CACHE_TTL: float = 60
+
+    # argon2 cost of new password hashes, pick them with
+    # `python -m core.passwords --budget-ms 250`. One lane per hash, the
+    # hashing pool already runs HASH_WORKERS of them in parallel
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536  # KiB
+    ARGON2_PARALLELISM: int = 1
+
+    # password hashing pool, see core/hashing.py
+    HASH_WORKERS: int = 4
+    HASH_MAX_PENDING: int = 64
+
+    # failed logins allowed per user name / client IP within the window
+    LOGIN_MAX_FAILURES_USER: int = 10
+    LOGIN_MAX_FAILURES_IP: int = 50
+    LOGIN_FAILURE_WINDOW: float = 300
+
+    # successful password checks remembered for repeated logins
+    LOGIN_CACHE_SIZE: int = 10000
+    LOGIN_CACHE_TTL: float = 60
 
     SECRET_KEY: str
     ALGORITHM: str
@@ -27,6 +81,7 @@ class Settings(BaseSettings):
     API_PREFIX_RANKING: str
     API_PREFIX_GOALTYPES: str
     API_PREFIX_STADIUMS: str
+    API_PREFIX_INTERNAL: str
 
 
 config = Settings()  # type: ignore
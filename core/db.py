@@ -1,44 +1,194 @@
-from sqlalchemy import create_engine
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event, exc
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.dml import UpdateBase
 from core.config import config
+from core.notify import create_notifier
+from core.params_cache import ParamsCache
 from sqlalchemy import text
 from typing import Annotated
 from fastapi import Depends
 
 
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, waited: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": 1000 * self.wait_total / attempts if attempts else 0.0,
+                "wait_max_ms": 1000 * self.wait_max,
+            }
+
+
+# QueuePool that records how long each checkout waited for a connection
+class InstrumentedQueuePool(QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record(time.perf_counter() - start)
+        return conn
+
+
+class RoutingSession(Session):
+    """Session for read-mostly requests.
+
+    Reads go to the replica picked when the session was opened. Flushes,
+    INSERT/UPDATE/DELETE statements and everything after the first write
+    go to the primary, so a request always reads its own writes.
+    """
+
+    def __init__(self, *args, replica=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replica = replica
+        self.wrote = False
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.replica is not None and not self.wrote:
+            if not self._flushing and not isinstance(clause, UpdateBase):
+                return self.replica
+            self.wrote = True
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+    # everything from now on goes to the primary, e.g. before a locking read
+    def use_primary(self):
+        self.wrote = True
+
+
 class Database:
-    def __init__(self, db_url: str):
-        self.engine = create_engine(db_url, pool_size=100)
+    def __init__(
+        self,
+        db_url: str,
+        pool_size: int = 100,
+        max_overflow: int = 10,
+        replica_urls: list = (),
+        replica_max_lag: float = 1.0,
+    ):
+        self.engine = self._create_engine(db_url, pool_size, max_overflow)
+        self.replicas = [
+            self._create_engine(url, pool_size, max_overflow) for url in replica_urls
+        ]
+        self.replica_max_lag = replica_max_lag
+        self.max_overflow = max_overflow
+        self._next_replica = itertools.count()
+        self._last_write = float("-inf")
+
         self.SessionLocal = sessionmaker(
             autocommit=False, autoflush=False, bind=self.engine
         )
+        self.ReadSessionLocal = sessionmaker(
+            class_=RoutingSession, autocommit=False, autoflush=False, bind=self.engine
+        )
+        event.listen(self.SessionLocal, "after_commit", self._mark_write)
+        event.listen(self.ReadSessionLocal, "after_commit", self._mark_write)
+
         self.Base = declarative_base()
         self.Base.metadata.create_all(bind=self.engine)
 
-    def get_db(self):
-        return self.SessionLocal()
+    @staticmethod
+    def _create_engine(url: str, pool_size: int, max_overflow: int):
+        return create_engine(
+            url,
+            poolclass=InstrumentedQueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+        )
 
-    def get_base(self):
-        return self.Base
+    def _mark_write(self, session):
+        self._last_write = time.monotonic()
 
-    def query(self, model):
-        return self.SessionLocal().query(model)
+    # round-robin over the replicas, or None (primary) while a recent write
+    # may not have reached them yet
+    def pick_replica(self):
+        if not self.replicas:
+            return None
+        if time.monotonic() - self._last_write < self.replica_max_lag:
+            return None
+        return self.replicas[next(self._next_replica) % len(self.replicas)]
 
-    def add(self, model):
+    # use outside of requests: `with db.session() as s: ...`
+    @contextmanager
+    def session(self):
         db = self.SessionLocal()
-        db.add(model)
-        db.commit()
-        db.refresh(model)
-        return model
+        try:
+            yield db
+        finally:
+            db.close()
 
-    def commit(self):
-        db = self.SessionLocal()
-        db.commit()
+    # request dependency, the connection goes back to the pool after the response
+    def get_db(self):
+        with self.session() as db:
+            yield db
 
-    def refresh(self, model):
-        db = self.SessionLocal()
-        db.refresh(model)
+    # session for reads, see RoutingSession
+    @contextmanager
+    def read_session(self):
+        db = self.ReadSessionLocal(replica=self.pick_replica())
+        try:
+            yield db
+        finally:
+            db.close()
+
+    # request dependency for read endpoints
+    def get_read_db(self):
+        with self.read_session() as db:
+            yield db
+
+    def get_base(self):
+        return self.Base
+
+    @staticmethod
+    def _pool_status(engine, max_overflow: int) -> dict:
+        pool = engine.pool
+        return {
+            "size": pool.size(),
+            "max_overflow": max_overflow,
+            "connections": pool.checkedout() + pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            # QueuePool counts overflow from -pool_size until the pool is full
+            "overflow": max(pool.overflow(), 0),
+            **pool.metrics.snapshot(),
+        }
+
+    def pool_status(self) -> dict:
+        res = self._pool_status(self.engine, self.max_overflow)
+        if self.replicas:
+            res["replicas"] = [
+                self._pool_status(engine, self.max_overflow) for engine in self.replicas
+            ]
+        return res
 
 
 print("Connecting to database...")
@@ -46,17 +196,32 @@ print(f"POSTGRES_SERVER: {config.POSTGRES_SERVER}")
 print(f"POSTGRES_PORT: {config.POSTGRES_PORT}")
 print(f"POSTGRES_DB: {config.POSTGRES_DB}")
 
-db_url = f"postgresql://{config.POSTGRES_USER}:{config.POSTGRES_PASSWORD}@{config.POSTGRES_SERVER}:{config.POSTGRES_PORT}/{config.POSTGRES_DB}"
-db = Database(db_url)
+db_url = (
+    config.DATABASE_URL
+    or f"postgresql://{config.POSTGRES_USER}:{config.POSTGRES_PASSWORD}@{config.POSTGRES_SERVER}:{config.POSTGRES_PORT}/{config.POSTGRES_DB}"
+)
+db = Database(
+    db_url,
+    config.DB_POOL_SIZE,
+    config.DB_MAX_OVERFLOW,
+    [url.strip() for url in config.POSTGRES_REPLICA_URLS.split(",") if url.strip()],
+    config.REPLICA_MAX_LAG,
+)
 Base = db.get_base()
 db_deps = Annotated[Session, Depends(db.get_db)]
+read_db_deps = Annotated[Session, Depends(db.get_read_db)]
+
+# cache invalidations between workers
+notifier = create_notifier(db.engine)
+params_cache = ParamsCache(notifier)
 
 print("Connected to database !")
 
 
+# read-only snapshot of the params row, cached until params_cache.bump()
 def get_params(model, db: Session):
     try:
-        params = db.query(model).first()
+        params = params_cache.get(model, db)
         return params
     # finally:
     #     db.close()
@@ -0,0 +1,112 @@
+import csv
+import io
+import threading
+import weakref
+
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+from core.config import config
+from core.db import db as database
+
+# a slot per running stream_query() export
+export_slots = threading.BoundedSemaphore(config.EXPORT_MAX_CONCURRENT)
+
+# format -> (media type, file extension)
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+}
+
+
+def parse_format(format: str) -> str:
+    if format not in FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "status": "error",
+                "message": f"Unknown format {format}, choose from "
+                f"{', '.join(FORMATS)}",
+            },
+        )
+    return format
+
+
+# rows (dicts) as chunks of NDJSON lines or CSV records, EXPORT_CHUNK_SIZE
+# rows per chunk
+def encode(rows, fields, format: str):
+    if format == "ndjson":
+        chunk = []
+        for row in rows:
+            chunk.append(orjson.dumps(dict(row)))
+            if len(chunk) >= config.EXPORT_CHUNK_SIZE:
+                yield b"\n".join(chunk) + b"\n"
+                chunk = []
+        if chunk:
+            yield b"\n".join(chunk) + b"\n"
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    count = 0
+    for row in rows:
+        writer.writerow([row[field] for field in fields])
+        count += 1
+        if count % config.EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+# select() of the visible rows of `model` by primary key, without the show
+# flag
+def visible_rows(model):
+    table = model.__table__
+    return (
+        select(*(column for column in table.columns if column.key != "show"))
+        .where(table.c.show == True)
+        .order_by(*table.primary_key.columns)
+    )
+
+
+def stream(rows, fields, format: str, name: str) -> StreamingResponse:
+    media_type, extension = FORMATS[format]
+    return StreamingResponse(
+        encode(rows, fields, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'},
+    )
+
+
+# Stream every row of `query` (a select()) as a file download. The rows
+# are read through a server-side cursor EXPORT_CHUNK_SIZE at a time, so
+# memory stays flat whatever the table size. The session belongs to the
+# generator: request dependencies are closed before the body is sent.
+# At most EXPORT_MAX_CONCURRENT of them run at once, the others get a 429
+# instead of waiting on the pool.
+def stream_query(query, format: str, name: str) -> StreamingResponse:
+    if not export_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=429,
+            detail={
+                "status": "error",
+                "message": "Too many exports running, try again later.",
+            },
+        )
+
+    def rows():
+        with database.read_session() as db:
+            result = db.execute(
+                query.execution_options(yield_per=config.EXPORT_CHUNK_SIZE)
+            )
+            for row in result.mappings():
+                yield row
+
+    body = rows()
+    # freed with the generator: sent, failed, or dropped before it started
+    weakref.finalize(body, export_slots.release)
+    return stream(body, list(query.selected_columns.keys()), format, name)
@@ -0,0 +1,281 @@
+import math
+import threading
+import time
+from collections import Counter
+
+from fuzzywuzzy import fuzz
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from core.config import config
+
+# n-gram size of the inverted index. Bigrams (rather than trigrams) still
+# give a usable lower bound on shared grams at the usual 80-90 thresholds,
+# see min_shared()
+GRAM = 2
+
+
+def grams(text: str) -> Counter:
+    return Counter(text[i : i + GRAM] for i in range(len(text) - GRAM + 1))
+
+
+# Lower bound on the number of bigrams (counted with multiplicity) two
+# strings share when fuzz.partial_ratio of them is >= threshold, where
+# `length` is the length of the shorter one.
+#
+# partial_ratio compares the shorter string (L chars) with a window of the
+# longer one (W <= L chars) and scores 2M / (L + W), M = matched chars. The
+# M chars sit in at most (L - M) + (W - M) + 1 contiguous blocks, and a block
+# of b chars holds b - 1 bigrams of both strings, so they share at least
+# 3M - L - W - 1 of them. With M >= t (L + W) / 2 and W >= t L / (2 - t)
+# that is at least (1.5t - 1) * 2L / (2 - t) - 1.
+def min_shared(length: int, threshold: int) -> int:
+    # the score is rounded to an int, so 79.5 already passes 80
+    t = (threshold - 0.5) / 100
+    if t <= 2 / 3:
+        return 0
+    return math.ceil((1.5 * t - 1) * 2 * length / (2 - t) - 1)
+
+
+# shortest string for which min_shared() is positive, None if there is none
+def min_length(threshold: int):
+    t = (threshold - 0.5) / 100
+    if t <= 2 / 3:
+        return None
+    length = 1
+    while min_shared(length, threshold) < 1:
+        length += 1
+    return length
+
+
+class FuzzyIndex:
+    """Bigram inverted index over one text column of the visible rows.
+
+    search() returns exactly what a fuzz.partial_ratio scan over every
+    visible row would, but only scores the rows that share enough bigrams
+    with the query to possibly reach the threshold (plus rows too short for
+    the bound to say anything). Queries too short to prune fall back to
+    scoring every entry, still without touching the database.
+
+    Entries follow committed inserts, updates and soft deletes through the
+    session events below; the whole index is also rebuilt every
+    FUZZY_INDEX_TTL seconds to pick up writes made by other workers.
+    """
+
+    def __init__(self, model, field: str, ttl: float):
+        self.model = model
+        self.field = field
+        self.ttl = ttl
+        self.pk = inspect(model).primary_key[0].key
+        self._lock = threading.RLock()
+        self._built_at = None
+        self._texts = {}  # id -> lowered text
+        self._values = {}  # id -> value as stored
+        self._grams = {}  # id -> Counter of bigrams
+        self._postings = {}  # bigram -> {id: count}
+        self._lengths = {}  # text length -> {ids}
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def _build(self, db: Session):
+        column = getattr(self.model, self.field)
+        rows = db.query(getattr(self.model, self.pk), column).filter(
+            getattr(self.model, "show") == True
+        )
+
+        self._texts = {}
+        self._values = {}
+        self._grams = {}
+        self._postings = {}
+        self._lengths = {}
+        for pk, text in rows:
+            self._add(pk, text)
+        self._built_at = time.monotonic()
+
+    def _ensure(self, db: Session):
+        if self._built_at is None or time.monotonic() - self._built_at > self.ttl:
+            self._build(db)
+
+    def _add(self, pk, value):
+        text = str(value).lower()
+        counts = grams(text)
+        self._texts[pk] = text
+        self._values[pk] = value
+        self._grams[pk] = counts
+        for gram, count in counts.items():
+            self._postings.setdefault(gram, {})[pk] = count
+        self._lengths.setdefault(len(text), set()).add(pk)
+
+    def _remove(self, pk):
+        text = self._texts.pop(pk, None)
+        if text is None:
+            return
+        del self._values[pk]
+        for gram in self._grams.pop(pk):
+            posting = self._postings[gram]
+            posting.pop(pk, None)
+            if not posting:
+                del self._postings[gram]
+        ids = self._lengths[len(text)]
+        ids.discard(pk)
+        if not ids:
+            del self._lengths[len(text)]
+
+    # text=None removes the entry (soft/hard delete)
+    def apply(self, pk, text):
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._remove(pk)
+            if text is not None:
+                self._add(pk, text)
+
+    def _candidates(self, query: str, threshold: int):
+        shortest = min_length(threshold)
+        if shortest is None or len(query) < shortest:
+            return list(self._texts)
+
+        shared = {}
+        for gram, count in grams(query).items():
+            for pk, n in self._postings.get(gram, {}).items():
+                shared[pk] = shared.get(pk, 0) + min(count, n)
+
+        res = [
+            pk
+            for pk, n in shared.items()
+            if n >= min_shared(min(len(query), len(self._texts[pk])), threshold)
+        ]
+        # rows shorter than `shortest` can match without sharing a bigram
+        for length, ids in self._lengths.items():
+            if length < shortest:
+                res.extend(pk for pk in ids if pk not in shared)
+        return res
+
+    # [(id, score)] of entries scoring >= threshold, best first then by id
+    def search(self, db: Session, query: str, threshold: int) -> list:
+        query = str(query).lower()
+        with self._lock:
+            self._ensure(db)
+            res = []
+            # rows sharing a text (positions, nations) are scored once
+            scores = {}
+            for pk in self._candidates(query, threshold):
+                text = self._texts[pk]
+                score = scores.get(text)
+                if score is None:
+                    score = scores[text] = fuzz.partial_ratio(text, query)
+                if score >= threshold:
+                    res.append((pk, score))
+
+        res.sort(key=lambda r: (-r[1], r[0]))
+        return res
+
+    def ids(self, db: Session, query: str, threshold: int) -> list:
+        return [pk for pk, _ in self.search(db, query, threshold)]
+
+    # the distinct stored values of the matching entries
+    def values(self, db: Session, query: str, threshold: int) -> list:
+        with self._lock:
+            matches = self.search(db, query, threshold)
+            return sorted({self._values[pk] for pk, _ in matches}, key=str)
+
+
+_indexes = {}  # (model, field) -> FuzzyIndex
+_indexes_lock = threading.Lock()
+
+
+def get_index(model, field: str) -> FuzzyIndex:
+    key = (model, field)
+    index = _indexes.get(key)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.setdefault(
+                key, FuzzyIndex(model, field, config.FUZZY_INDEX_TTL)
+            )
+    return index
+
+
+# row ids whose `field` fuzzy-matches `query`, best match first
+def fuzzy_ids(db: Session, model, field: str, query: str, threshold: int) -> list:
+    return get_index(model, field).ids(db, query, threshold)
+
+
+# Distinct values of `field` that fuzzy-match `query`. For a column shared by
+# many rows (positions, nations) filter with field.in_(values) rather than
+# the ids: a handful of bind parameters on the indexed column instead of one
+# per matching row.
+def fuzzy_values(db: Session, model, field: str, query: str, threshold: int) -> list:
+    return get_index(model, field).values(db, query, threshold)
+
+
+# [(row, score)] of the best `limit` visible matches that also satisfy the
+# `where` clauses, best first
+def fuzzy_search(
+    db: Session,
+    model,
+    field: str,
+    query: str,
+    threshold: int,
+    limit: int = None,
+    where=(),
+) -> list:
+    index = get_index(model, field)
+    matches = index.search(db, query, threshold)
+    if not matches:
+        return []
+
+    pk = getattr(model, index.pk)
+    ids = [i for i, _ in matches]
+    rows = {
+        getattr(row, index.pk): row
+        for row in db.query(model).filter(
+            getattr(model, "show") == True, pk.in_(ids), *where
+        )
+    }
+    return [(rows[i], score) for i, score in matches if i in rows][:limit]
+
+
+# the visible rows behind fuzzy_ids(), in the same order
+def fuzzy_rows(db: Session, model, field: str, query: str, threshold: int) -> list:
+    return [row for row, _ in fuzzy_search(db, model, field, query, threshold)]
+
+
+# Changes are collected at flush time and applied once the transaction
+# commits, so a rolled back write never reaches the index.
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    pending = session.info.setdefault("fuzzy_index", [])
+    for objs, deleted in (
+        (session.new, False),
+        (session.dirty, False),
+        (session.deleted, True),
+    ):
+        for obj in objs:
+            for (model, field), index in list(_indexes.items()):
+                if not isinstance(obj, model):
+                    continue
+                state = inspect(obj)
+                pk = state.dict.get(index.pk)
+                loaded = field in state.dict and "show" in state.dict
+                if pk is None or not (deleted or loaded):
+                    # nothing to go on, reload the whole index on next use
+                    pending.append((index, None, None))
+                    continue
+                visible = not deleted and state.dict["show"]
+                pending.append((index, pk, state.dict[field] if visible else None))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_changes(session):
+    for index, pk, text in session.info.pop("fuzzy_index", []):
+        if pk is None:
+            index.invalidate()
+        else:
+            index.apply(pk, text)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session):
+    session.info.pop("fuzzy_index", None)
@@ -0,0 +1,62 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+
+class HashingBusy(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=429,
+            detail={
+                "status": "error",
+                "message": "Too many password checks in progress, try again later.",
+            },
+            headers={"Retry-After": "1"},
+        )
+
+
+class HashingPool:
+    """Bounded thread pool for password hashing and verification.
+
+    At most `workers` hashes run at once, so logins cannot starve the request
+    threads of CPU, and at most `max_pending` more wait for a worker. Beyond
+    that run() fails fast with HashingBusy (429) instead of queueing without
+    bound. Threads are enough: bcrypt and argon2 release the GIL while
+    hashing.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="hashing"
+        )
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashingBusy()
+
+        with self._lock:
+            self.in_flight += 1
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "in_flight": self.in_flight,
+                "rejected": self.rejected,
+            }
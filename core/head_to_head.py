@@ -0,0 +1,66 @@
+import numpy as np
+
+from core.priority import NO_HEAD_TO_HEAD
+
+
+class HeadToHead:
+    """Pairwise results of every club against every other club.
+
+    points[i, j] holds the points club i took from its matches against
+    club j and goals[i, j] the goals it scored in them, so the mini-league
+    of any tied group is a sum over the group's sub-matrix.
+    """
+
+    def __init__(self, results, points_win: int, points_draw: int, points_lose: int):
+        club_ids = sorted({team for result in results for team in result[:2]})
+        self.index = {club_id: i for i, club_id in enumerate(club_ids)}
+
+        n = len(club_ids)
+        self.points = np.zeros((n, n), dtype=np.int32)
+        self.goals = np.zeros((n, n), dtype=np.int32)
+
+        if not results:
+            return
+
+        team1 = np.array([self.index[r[0]] for r in results], dtype=np.intp)
+        team2 = np.array([self.index[r[1]] for r in results], dtype=np.intp)
+        goal1 = np.array([r[2] for r in results], dtype=np.int32)
+        goal2 = np.array([r[3] for r in results], dtype=np.int32)
+
+        points1 = np.where(
+            goal1 > goal2,
+            points_win,
+            np.where(goal1 == goal2, points_draw, points_lose),
+        )
+        points2 = np.where(
+            goal2 > goal1,
+            points_win,
+            np.where(goal1 == goal2, points_draw, points_lose),
+        )
+
+        # add.at so repeated fixtures between the same pair accumulate
+        np.add.at(self.points, (team1, team2), points1)
+        np.add.at(self.points, (team2, team1), points2)
+        np.add.at(self.goals, (team1, team2), goal1)
+        np.add.at(self.goals, (team2, team1), goal2)
+
+    # mini-league of one tied group: {club_id: (points, gdif, goals)}
+    def resolve(self, club_ids) -> dict:
+        res = {club_id: NO_HEAD_TO_HEAD for club_id in club_ids}
+        known = [c for c in club_ids if c in self.index]
+        if len(known) < 2:
+            return res
+
+        idx = np.array([self.index[c] for c in known], dtype=np.intp)
+        sub = np.ix_(idx, idx)
+        points = self.points[sub].sum(axis=1)
+        scored = self.goals[sub].sum(axis=1)
+        conceded = self.goals[sub].sum(axis=0)
+
+        for k, club_id in enumerate(known):
+            res[club_id] = (
+                int(points[k]),
+                int(scored[k] - conceded[k]),
+                int(scored[k]),
+            )
+        return res
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import threading
+from datetime import datetime
+
+from core.config import config
+from core.db import notifier
+from core.notify import MAX_PAYLOAD
+
+LIVE_CHANNEL = "live_scores"
+
+# sent instead of whatever a subscriber missed, the client should refetch
+RESYNC = b"event: resync\ndata: {}\n\n"
+
+
+def match_topic(match_id: int) -> str:
+    return f"match:{match_id}"
+
+
+# matchday of a kick-off, the same calendar day rounds of the standings use
+def round_topic(day) -> str:
+    return f"round:{day.isoformat()}"
+
+
+def sse(event: str, data) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode()
+
+
+class Subscription:
+    """Frames for one client, in a bounded queue of its event loop.
+
+    A client that falls `maxsize` frames behind loses its backlog and gets
+    RESYNC instead, so one slow reader never holds memory or slows down
+    the others.
+    """
+
+    def __init__(self, topics, maxsize: int):
+        self.topics = topics
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, frame: bytes):
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.dropped += 1
+            frame = RESYNC
+        self.queue.put_nowait(frame)
+
+
+class LiveBroker:
+    """Fan-out of live score changes to SSE subscribers.
+
+    Writers call publish() from any thread after committing. Messages go
+    through the notifier, so subscribers connected to other workers get
+    them too. Each message is encoded once and handed to every event loop
+    with subscribers in a single call, however many subscribers there are.
+    """
+
+    def __init__(self, notifier, buffer_size: int):
+        self.notifier = notifier
+        self.buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._topics = {}  # topic -> {Subscription}
+        notifier.subscribe(LIVE_CHANNEL, self._on_message)
+
+    # call from the event loop that will read the subscription
+    def subscribe(self, *topics) -> Subscription:
+        subscription = Subscription(topics, self.buffer_size)
+        with self._lock:
+            for topic in topics:
+                self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._topics.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._topics[topic]
+
+    # Messages travel as NOTIFY payloads, so they have to stay under
+    # MAX_PAYLOAD: one whose list of event ids is too long goes out as
+    # several frames, each with part of the ids
+    def publish(self, topics, event: str, data: dict):
+        payload = json.dumps(
+            {"topics": list(topics), "event": event, "data": data}, default=str
+        )
+        ids = data.get("event_ids", ())
+        if len(payload.encode()) > MAX_PAYLOAD and len(ids) > 1:
+            half = len(ids) // 2
+            self.publish(topics, event, {**data, "event_ids": ids[:half]})
+            self.publish(topics, event, {**data, "event_ids": ids[half:]})
+            return
+        self.notifier.publish(LIVE_CHANNEL, payload)
+
+    def _on_message(self, payload):
+        with self._lock:
+            if payload is None:
+                # the notifier lost messages, everyone has to refetch
+                subscribers = set().union(*self._topics.values())
+                frame = RESYNC
+            else:
+                message = json.loads(payload)
+                subscribers = set()
+                for topic in message["topics"]:
+                    subscribers |= self._topics.get(topic, set())
+                frame = sse(message["event"], message["data"])
+
+        loops = {}
+        for subscription in subscribers:
+            loops.setdefault(subscription.loop, []).append(subscription)
+        for loop, group in loops.items():
+            try:
+                loop.call_soon_threadsafe(_deliver, group, frame)
+            except RuntimeError:
+                # loop closed, its subscriptions are going away
+                pass
+
+    def status(self) -> dict:
+        with self._lock:
+            subscribers = set().union(*self._topics.values())
+            return {
+                "topics": len(self._topics),
+                "subscribers": len(subscribers),
+                "dropped": sum(s.dropped for s in subscribers),
+            }
+
+
+def _deliver(subscriptions, frame: bytes):
+    for subscription in subscriptions:
+        subscription.put(frame)
+
+
+live = LiveBroker(notifier, config.LIVE_BUFFER_SIZE)
+
+
+# score of a match plus the ids of the events that changed it, to the
+# subscribers of the match and of its matchday. Clients fetch the events
+# themselves if they need more than the score
+def publish_match(match, event: str, changed_events=()):
+    topics = [match_topic(match.match_id)]
+    if match.start is not None:
+        topics.append(round_topic(datetime.fromtimestamp(match.start).date()))
+
+    data = {
+        "match_id": match.match_id,
+        "team1": match.team1,
+        "team2": match.team2,
+        "goal1": match.goal1,
+        "goal2": match.goal2,
+    }
+    if changed_events:
+        # ORM rows or dicts of their columns
+        data["event_ids"] = [
+            e["event_id"] if isinstance(e, dict) else e.event_id for e in changed_events
+        ]
+    live.publish(topics, event, data)
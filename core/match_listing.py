@@ -0,0 +1,81 @@
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.orm import Session, aliased
+
+from core.pagination import keyset, next_page, page_size
+from schemas.db import Clubs, Matches, Referees, Stadiums
+
+EXPANDABLE = ("teams", "stadium", "referees")
+
+
+# "teams,stadium" -> {"teams", "stadium"}, 400 on anything else
+def parse_expand(expand: str | None) -> set:
+    if not expand:
+        return set()
+
+    fields = {field.strip() for field in expand.split(",") if field.strip()}
+    unknown = fields - set(EXPANDABLE)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "status": "error",
+                "message": f"Cannot expand {', '.join(sorted(unknown))}, "
+                f"choose from {', '.join(EXPANDABLE)}",
+            },
+        )
+    return fields
+
+
+# SELECT of the MatchResponse fields; `expand` joins in the names behind
+# the ids as team1_name/team2_name, stadium_name and ref_name/var_name/
+# lineman_name. Outer joins, so a dangling id gives a null name rather than
+# dropping the match.
+def match_query(expand: set = frozenset()):
+    query = select(
+        Matches.match_id,
+        Matches.team1,
+        Matches.team2,
+        Matches.start,
+        Matches.finish,
+        Matches.stadium,
+        Matches.goal1,
+        Matches.goal2,
+        Matches.ref_id.label("ref"),
+        Matches.var_id.label("var"),
+        Matches.lineman_id.label("lineman"),
+    )
+
+    if "teams" in expand:
+        for field in ("team1", "team2"):
+            club = aliased(Clubs)
+            query = query.outerjoin(
+                club, club.club_id == getattr(Matches, field)
+            ).add_columns(club.club_name.label(f"{field}_name"))
+
+    if "stadium" in expand:
+        query = query.outerjoin(
+            Stadiums, Stadiums.std_id == Matches.stadium
+        ).add_columns(Stadiums.std_name.label("stadium_name"))
+
+    if "referees" in expand:
+        for field in ("ref", "var", "lineman"):
+            referee = aliased(Referees)
+            query = query.outerjoin(
+                referee, referee.ref_id == getattr(Matches, f"{field}_id")
+            ).add_columns(referee.ref_name.label(f"{field}_name"))
+
+    return query
+
+
+# One page of the visible matches passing `filters`, by start time, as
+# (plain dicts ready for ORJSONResponse, next cursor)
+def match_rows(
+    db: Session, expand: set, *filters, limit: int = None, cursor: str = None
+):
+    keys = (Matches.start, Matches.match_id)
+    limit = page_size(limit)
+    query = match_query(expand).where(Matches.show == True, *filters)
+
+    rows = db.execute(keyset(query, keys, limit, cursor)).mappings()
+    return next_page([dict(row) for row in rows], keys, limit)
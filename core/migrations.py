@@ -0,0 +1,59 @@
+import os
+from glob import glob
+
+from loguru import logger
+from sqlalchemy import text
+
+# any constant shared by every worker, so only one of them migrates at a time
+MIGRATION_LOCK_ID = 104
+
+
+# Run the data/migrations/*.sql files that have not been applied yet, in name
+# order, each in its own transaction. A failing file is logged and stops the
+# run, so it is retried on the next start. Postgres only.
+def apply_migrations(engine, path: str):
+    if engine.dialect.name != "postgresql":
+        return
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        try:
+            conn.execute(
+                text(
+                    "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                    "name VARCHAR(255) PRIMARY KEY, "
+                    "applied_at TIMESTAMP DEFAULT now())"
+                )
+            )
+            conn.commit()
+            applied = {
+                name
+                for (name,) in conn.execute(text("SELECT name FROM schema_migrations"))
+            }
+            conn.commit()
+
+            for file in sorted(glob(os.path.join(path, "*.sql"))):
+                name = os.path.basename(file)
+                if name in applied:
+                    continue
+
+                with open(file) as f:
+                    sql = f.read()
+                try:
+                    # psycopg2 reads % as a placeholder, e.g. in format()
+                    conn.exec_driver_sql(sql.replace("%", "%%"))
+                    conn.execute(
+                        text("INSERT INTO schema_migrations (name) VALUES (:name)"),
+                        {"name": name},
+                    )
+                    conn.commit()
+                    logger.info(f"Applied migration {name}")
+                except Exception as e:
+                    conn.rollback()
+                    logger.error(f"Migration {name} failed: {str(e)}")
+                    break
+        finally:
+            conn.execute(
+                text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID}
+            )
+            conn.commit()
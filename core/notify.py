@@ -0,0 +1,183 @@
+import select
+import threading
+import uuid
+
+from loguru import logger
+from sqlalchemy import text
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more; what is passed to
+# publish() has to stay within MAX_PAYLOAD, leaving room for the origin tag
+MAX_PAYLOAD = 7900
+
+
+class LocalNotifier:
+    """In-process publish/subscribe of cache invalidations.
+
+    Callbacks get the published payload, or None when they should assume
+    they missed messages and resync. Enough for a single worker and for
+    tests; PgNotifier extends it across workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # channel -> [callback]
+
+    def subscribe(self, channel: str, callback):
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(callback)
+
+    def publish(self, channel: str, payload: str = "", session=None):
+        self._deliver(channel, payload)
+
+    def _deliver(self, channel: str, payload):
+        for callback in list(self._subscribers.get(channel, ())):
+            try:
+                callback(payload)
+            except Exception as e:
+                logger.error(f"Notification handler for {channel} failed: {str(e)}")
+
+    def _resync(self):
+        for channel in list(self._subscribers):
+            self._deliver(channel, None)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class PgNotifier(LocalNotifier):
+    """Postgres LISTEN/NOTIFY transport for LocalNotifier.
+
+    publish() delivers locally right away and NOTIFYs the other workers; a
+    background thread LISTENs on a dedicated connection and delivers what
+    the other workers publish. After every (re)connect subscribers are told
+    to resync, since notifications sent while disconnected are lost.
+
+    A notification that cannot be sent (database error, payload over
+    MAX_PAYLOAD) is not retried as is. The listener thread instead sends a
+    bare resync marker on that channel as soon as it can, and the other
+    workers pass None to their subscribers, just as after a reconnect.
+    """
+
+    def __init__(self, engine, poll_interval: float = 5.0):
+        super().__init__()
+        self.engine = engine
+        self.poll_interval = poll_interval
+        # tags our own notifications so the listener can skip them
+        self.origin = uuid.uuid4().hex
+        self._stop = threading.Event()
+        self._thread = None
+        self._lost = set()  # channels the other workers have to resync
+
+    # with a session the NOTIFY is part of its transaction: it is sent when
+    # the session commits, and a failure is raised to the caller
+    def publish(self, channel: str, payload: str = "", session=None):
+        self._deliver(channel, payload)
+        if len(payload.encode()) > MAX_PAYLOAD:
+            logger.error(f"NOTIFY {channel} failed: payload too large")
+            self._lose(channel)
+            return
+        if session is not None:
+            session.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": channel, "payload": f"{self.origin}:{payload}"},
+            )
+            return
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(
+                    text("SELECT pg_notify(:channel, :payload)"),
+                    {"channel": channel, "payload": f"{self.origin}:{payload}"},
+                )
+                conn.commit()
+        except Exception as e:
+            logger.error(f"NOTIFY {channel} failed: {str(e)}")
+            self._lose(channel)
+
+    def _lose(self, channel: str):
+        with self._lock:
+            self._lost.add(channel)
+
+    # tell the other workers to resync the channels we failed to notify
+    def _send_resyncs(self, raw):
+        with self._lock:
+            lost, self._lost = self._lost, set()
+        try:
+            with raw.cursor() as cursor:
+                while lost:
+                    channel = next(iter(lost))
+                    cursor.execute(
+                        "SELECT pg_notify(%s, %s)", (channel, f"{self.origin}!")
+                    )
+                    lost.discard(channel)
+        finally:
+            with self._lock:
+                self._lost |= lost
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="pg-notifier", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.poll_interval + 1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                # a connection of its own, outside the pool
+                conn = self.engine.raw_connection()
+                conn.detach()
+                raw = conn.dbapi_connection
+                raw.autocommit = True
+                self._listen(raw)
+            except Exception as e:
+                logger.error(f"LISTEN connection lost: {str(e)}")
+                self._stop.wait(self.poll_interval)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _listen(self, raw):
+        listening = set()
+        resynced = False
+        while not self._stop.is_set():
+            # channels subscribed since the last round
+            with raw.cursor() as cursor:
+                for channel in set(self._subscribers) - listening:
+                    cursor.execute(f'LISTEN "{channel}"')
+                    listening.add(channel)
+            if not resynced:
+                self._resync()
+                resynced = True
+            if self._lost:
+                self._send_resyncs(raw)
+
+            if select.select([raw], [], [], self.poll_interval) == ([], [], []):
+                continue
+            raw.poll()
+            while raw.notifies:
+                notify = raw.notifies.pop(0)
+                origin, sep, payload = notify.payload.partition(":")
+                if not sep:
+                    # "<origin>!": that worker lost a notification
+                    if origin[:-1] != self.origin:
+                        self._deliver(notify.channel, None)
+                elif origin != self.origin:
+                    self._deliver(notify.channel, payload)
+
+
+def create_notifier(engine) -> LocalNotifier:
+    if engine.dialect.name == "postgresql":
+        return PgNotifier(engine)
+    return LocalNotifier()
@@ -0,0 +1,73 @@
+import base64
+import json
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+from core.config import config
+
+# Keyset pagination. A page is the first `limit` rows ordered by `keys`
+# (unique together, e.g. (Matches.start, Matches.match_id)) that come after
+# the cursor; the cursor is the keys of the last row of the previous page,
+# so no page needs an OFFSET scan whatever its depth. Cursors are opaque to
+# clients: base64 of the key values.
+
+
+def page_size(limit: int | None) -> int:
+    if limit is None:
+        return config.PAGE_SIZE
+    return max(1, min(limit, config.MAX_PAGE_SIZE))
+
+
+def encode_cursor(values) -> str:
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except Exception:
+        values = None
+
+    if (
+        not isinstance(values, list)
+        or len(values) != size
+        or not all(isinstance(v, (int, float, str)) for v in values)
+    ):
+        raise HTTPException(
+            status_code=400, detail={"status": "error", "message": "Invalid cursor"}
+        )
+    return values
+
+
+# `query` (a Query or a select()) restricted to the page after `cursor`,
+# with one extra row to tell whether another page follows
+def keyset(query, keys, limit: int, cursor: str = None):
+    if cursor:
+        values = decode_cursor(cursor, len(keys))
+        query = query.where(tuple_(*keys) > tuple(values))
+    return query.order_by(*keys).limit(limit + 1)
+
+
+# (rows of the page, cursor of the next page or None) from rows fetched
+# with keyset(); rows are ORM objects or mappings
+def next_page(rows, keys, limit: int):
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    if isinstance(last, dict):
+        values = [last[key.key] for key in keys]
+    else:
+        values = [getattr(last, key.key) for key in keys]
+    return rows, encode_cursor(values)
+
+
+# (rows, next cursor) of one page of an ORM query
+def paginate(query, keys, limit: int = None, cursor: str = None):
+    limit = page_size(limit)
+    return next_page(keyset(query, keys, limit, cursor).all(), keys, limit)
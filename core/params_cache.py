@@ -0,0 +1,62 @@
+import threading
+from dataclasses import make_dataclass
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+PARAMS_CHANNEL = "params_changed"
+
+
+class ParamsCache:
+    """Process-wide, read-only snapshot of the single params row.
+
+    Every writer of the params table calls bump(): the version goes up, the
+    snapshot is dropped and the other workers are told to drop theirs
+    through the notifier. Readers get a frozen dataclass, so a validator
+    cannot change the params of everyone else by accident.
+    """
+
+    def __init__(self, notifier):
+        self._lock = threading.Lock()
+        self._snapshots = {}  # model -> snapshot
+        self._types = {}  # model -> frozen dataclass
+        self.version = 0
+        self.notifier = notifier
+        notifier.subscribe(PARAMS_CHANNEL, self.invalidate)
+
+    def _snapshot_type(self, model):
+        if model not in self._types:
+            fields = [c.key for c in inspect(model).column_attrs] + ["version"]
+            self._types[model] = make_dataclass(
+                f"{model.__name__}Snapshot", fields, frozen=True
+            )
+        return self._types[model]
+
+    def get(self, model, db: Session):
+        snapshot = self._snapshots.get(model)
+        if snapshot is not None:
+            return snapshot
+
+        version = self.version
+        row = db.query(model).first()
+        if row is None:
+            return None
+
+        values = {c.key: getattr(row, c.key) for c in inspect(model).column_attrs}
+        snapshot = self._snapshot_type(model)(version=version, **values)
+        with self._lock:
+            # a bump while we were reading makes this snapshot stale already
+            if self.version == version:
+                self._snapshots[model] = snapshot
+        return snapshot
+
+    # notifier callback, also used after a local write
+    def invalidate(self, payload=None):
+        with self._lock:
+            self.version += 1
+            self._snapshots = {}
+
+    # call after committing a change to the params table
+    def bump(self):
+        self.invalidate()
+        self.notifier.publish(PARAMS_CHANNEL, str(self.version))
@@ -0,0 +1,69 @@
+import argparse
+import statistics
+import time
+
+from passlib.context import CryptContext
+
+from core.config import config
+
+# New hashes are argon2id with the configured cost. bcrypt hashes from
+# before still verify, and like argon2 hashes of an older cost they are
+# reported by verify_and_update() so the caller can store a fresh hash.
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__time_cost=config.ARGON2_TIME_COST,
+    argon2__memory_cost=config.ARGON2_MEMORY_COST,
+    argon2__parallelism=config.ARGON2_PARALLELISM,
+)
+
+
+# median seconds one argon2 hash takes with the given cost
+def measure(time_cost: int, memory_cost: int, parallelism: int, rounds: int = 5):
+    context = pwd_context.copy(
+        argon2__time_cost=time_cost,
+        argon2__memory_cost=memory_cost,
+        argon2__parallelism=parallelism,
+    )
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        context.hash("calibration password")
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+# The most expensive (time_cost, memory_cost) hashing within `budget`
+# seconds on this machine. Memory is kept at `memory_cost` KiB and the time
+# cost raised as far as the budget allows; if even one pass is too slow the
+# memory is halved instead, down to 8 MiB.
+def calibrate(budget: float, memory_cost: int, parallelism: int):
+    while memory_cost > 8192 and measure(1, memory_cost, parallelism) > budget:
+        memory_cost //= 2
+
+    time_cost = 1
+    while measure(time_cost + 1, memory_cost, parallelism) <= budget:
+        time_cost += 1
+    return time_cost, memory_cost
+
+
+if __name__ == "__main__":
+    # python -m core.passwords --budget-ms 250
+    parser = argparse.ArgumentParser(
+        description="Pick argon2 cost parameters for a per-hash latency budget"
+    )
+    parser.add_argument("--budget-ms", type=float, default=250)
+    parser.add_argument("--memory-cost", type=int, default=config.ARGON2_MEMORY_COST)
+    parser.add_argument("--parallelism", type=int, default=config.ARGON2_PARALLELISM)
+    args = parser.parse_args()
+
+    time_cost, memory_cost = calibrate(
+        args.budget_ms / 1000, args.memory_cost, args.parallelism
+    )
+    took = measure(time_cost, memory_cost, args.parallelism)
+
+    print(f"# one hash takes {took * 1000:.0f} ms, add to .env:")
+    print(f"ARGON2_TIME_COST={time_cost}")
+    print(f"ARGON2_MEMORY_COST={memory_cost}")
+    print(f"ARGON2_PARALLELISM={args.parallelism}")
@@ -0,0 +1,86 @@
+from functools import lru_cache
+
+# Params.priority tokens -> standings column, highest value ranks first
+CRITERIA = {
+    "p": "club_points",
+    "d": "club_gdif",
+    "g": "club_goals",
+    "a": "away_goals",
+    "w": "club_win",
+}
+HEAD_TO_HEAD = "h"
+
+# head-to-head key of a club that is not tied with anyone
+NO_HEAD_TO_HEAD = (0, 0, 0)
+
+
+def _tuple_getter(fields):
+    if not fields:
+        return lambda row: ()
+    return lambda row: tuple([row[f] for f in fields])
+
+
+class PrioritySorter:
+    """Sort key compiled from a Params.priority string such as "p;d;g;h".
+
+    Criteria before "h" are compared first. Clubs that tie on all of them
+    are then compared on their head-to-head record against each other
+    (points, goal difference, goals), then on the criteria after "h".
+    """
+
+    def __init__(self, before: list, after: list, head_to_head: bool):
+        self.before = before
+        self.after = after
+        self.head_to_head = head_to_head
+        self._before_key = _tuple_getter(before)
+        self._after_key = _tuple_getter(after)
+
+    # head_to_head(club_ids) -> {club_id: (points, gdif, goals)} for one tied group
+    def sort(self, rows: list, head_to_head=None) -> list:
+        before_key = self._before_key
+        after_key = self._after_key
+
+        if not self.head_to_head or head_to_head is None:
+            return sorted(
+                rows, key=lambda r: before_key(r) + after_key(r), reverse=True
+            )
+
+        groups = {}
+        for row in rows:
+            groups.setdefault(before_key(row), []).append(row["club_id"])
+
+        h2h = {}
+        for club_ids in groups.values():
+            if len(club_ids) > 1:
+                h2h.update(head_to_head(club_ids))
+
+        return sorted(
+            rows,
+            key=lambda r: before_key(r)
+            + h2h.get(r["club_id"], NO_HEAD_TO_HEAD)
+            + after_key(r),
+            reverse=True,
+        )
+
+
+# parsed once per distinct priority string, so a params update that changes
+# the string simply compiles a new sorter
+@lru_cache(maxsize=16)
+def compile_priority(priority: str) -> PrioritySorter:
+    tokens = [t.strip().lower() for t in (priority or "").split(";") if t.strip()]
+
+    before = []
+    after = []
+    head_to_head = False
+    for token in tokens:
+        if token == HEAD_TO_HEAD:
+            head_to_head = True
+            continue
+        if token not in CRITERIA:
+            raise ValueError(f"Unknown ranking priority: {token}")
+
+        fields = after if head_to_head else before
+        if CRITERIA[token] not in before + after:
+            fields.append(CRITERIA[token])
+
+    return PrioritySorter(before, after, head_to_head)
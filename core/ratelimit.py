@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+from fastapi import HTTPException
+
+
+class TooManyAttempts(HTTPException):
+    def __init__(self, retry_after: float):
+        super().__init__(
+            status_code=429,
+            detail={
+                "status": "error",
+                "message": "Too many failed login attempts, try again later.",
+            },
+            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+        )
+
+
+class MemoryBackend:
+    """Sliding-window attempt log kept in this process.
+
+    A backend stores timestamps per key and answers three calls:
+    acquire(key, limit, window) records an attempt unless `limit` of them
+    already fall within the last `window` seconds, atomically, and returns
+    (timestamp of the attempt or None, seconds until the oldest attempt
+    leaves the window); release(key, timestamp) takes one attempt back and
+    reset(key) forgets them all. A shared store (e.g. a Redis sorted set
+    per key, with a Lua script for acquire) only has to implement the same
+    three to rate limit across workers.
+
+    At most `max_keys` keys are tracked, the least recently hit go first.
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._hits = OrderedDict()  # key -> deque of timestamps
+
+    def _prune(self, key, window: float, now: float):
+        hits = self._hits.get(key)
+        if hits is None:
+            return None
+        while hits and hits[0] <= now - window:
+            hits.popleft()
+        if not hits:
+            del self._hits[key]
+            return None
+        return hits
+
+    def acquire(self, key, limit: int, window: float):
+        now = time.time()
+        with self._lock:
+            hits = self._prune(key, window, now)
+            if hits is not None and len(hits) >= limit:
+                return None, hits[0] + window - now
+            if hits is None:
+                hits = self._hits[key] = deque()
+            hits.append(now)
+            self._hits.move_to_end(key)
+            while len(self._hits) > self.max_keys:
+                self._hits.popitem(last=False)
+            return now, 0.0
+
+    def release(self, key, stamp: float):
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                return
+            try:
+                hits.remove(stamp)
+            except ValueError:
+                # already out of the window
+                return
+            if not hits:
+                del self._hits[key]
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+
+class RateLimiter:
+    """At most `limit` recorded attempts per key within `window` seconds.
+
+    An attempt is recorded when it is admitted, so concurrent requests
+    cannot all pass before any of them counts; release() refunds the
+    attempts that turned out not to count (e.g. a successful login).
+    """
+
+    def __init__(self, backend, limit: int, window: float):
+        self.backend = backend
+        self.limit = limit
+        self.window = window
+
+    # records an attempt for every key and returns them for release(), or
+    # raises TooManyAttempts (recording nothing) if any key is over its limit
+    def acquire(self, *keys) -> list:
+        attempts = []
+        for key in keys:
+            stamp, retry_after = self.backend.acquire(key, self.limit, self.window)
+            if stamp is None:
+                self.release(attempts)
+                raise TooManyAttempts(retry_after)
+            attempts.append((key, stamp))
+        return attempts
+
+    def release(self, attempts):
+        for key, stamp in attempts:
+            self.backend.release(key, stamp)
+
+    def reset(self, *keys):
+        for key in keys:
+            self.backend.reset(key)
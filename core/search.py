@@ -0,0 +1,64 @@
+import threading
+
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.orm import Session
+
+from core.fuzzy_index import fuzzy_search
+
+_trgm = {}  # engine url -> pg_trgm installed
+_trgm_lock = threading.Lock()
+
+
+def trgm_available(db: Session) -> bool:
+    bind = db.get_bind()
+    if bind.dialect.name != "postgresql":
+        return False
+
+    key = str(bind.url)
+    if key not in _trgm:
+        with _trgm_lock:
+            if key not in _trgm:
+                _trgm[key] = db.execute(
+                    text(
+                        "SELECT EXISTS "
+                        "(SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')"
+                    )
+                ).scalar()
+    return _trgm[key]
+
+
+# [(row, score)] of the best `limit` visible rows of `model` whose `field`
+# matches `query` (and that satisfy the `where` clauses), best first, scores
+# 0-100.
+#
+# On Postgres with pg_trgm (data/migrations/001_pg_trgm_search.sql) the
+# score is word_similarity(query, field), i.e. how well the query matches
+# some part of the name, and the filter is served by the trigram GIN index.
+# Elsewhere it is fuzz.partial_ratio from the in-process fuzzy index.
+def search(
+    db: Session, model, field: str, query: str, threshold: int, limit: int, where=()
+) -> list:
+    if not trgm_available(db):
+        return fuzzy_search(db, model, field, query, threshold, limit, where)
+
+    column = getattr(model, field)
+    pk = getattr(model, inspect(model).primary_key[0].key)
+    score = func.word_similarity(query, column)
+
+    # the threshold of the indexable %> operator, for this transaction only
+    db.execute(
+        select(
+            func.set_config(
+                "pg_trgm.word_similarity_threshold",
+                str(min(max(threshold, 0), 100) / 100),
+                True,
+            )
+        )
+    )
+    rows = db.execute(
+        select(model, score)
+        .where(getattr(model, "show") == True, column.op("%>")(query), *where)
+        .order_by(score.desc(), pk)
+        .limit(limit)
+    ).all()
+    return [(row, round(value * 100)) for row, value in rows]
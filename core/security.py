@@ -1,19 +1,75 @@
-from passlib.context import CryptContext
+import hashlib
+import hmac
+import secrets
+
 from datetime import datetime, timedelta
 from fastapi import HTTPException
 from jose import jwt
+from core.cache import TTLCache
 from core.config import config
+from core.hashing import HashingPool
+from core.passwords import pwd_context
 
 
-bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+hashing_pool = HashingPool(config.HASH_WORKERS, config.HASH_MAX_PENDING)
 
 
+# All of these run on hashing_pool and raise HashingBusy (429) when it is
+# saturated. A stored hash in an unknown format never verifies.
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt_context.verify(plain_password, hashed_password)
+    return verify_and_update(plain_password, hashed_password)[0]
+
+
+# (verified, new hash) where the new hash is set when the stored one uses an
+# outdated scheme or cost and should be replaced
+def verify_and_update(plain_password: str, hashed_password: str):
+    if not hashed_password or pwd_context.identify(hashed_password) is None:
+        return False, None
+    return hashing_pool.run(
+        pwd_context.verify_and_update, plain_password, hashed_password
+    )
+
+
+# (user name, password hash) -> HMAC of the password, for recent successful
+# checks. The stored hash is part of the key, so a password change drops the
+# entry; the HMAC key never leaves the process.
+verified_cache = TTLCache(config.LOGIN_CACHE_SIZE, config.LOGIN_CACHE_TTL)
+_verified_key = secrets.token_bytes(32)
+
+
+# verify_and_update() that skips hashing when the same password was
+# accepted for the user within LOGIN_CACHE_TTL seconds
+def verify_password_cached(username: str, plain_password: str, hashed_password: str):
+    key = (username, hashed_password)
+    digest = hmac.new(_verified_key, plain_password.encode(), hashlib.sha256).digest()
+
+    cached = verified_cache.get(key)
+    if cached is not None and hmac.compare_digest(cached, digest):
+        return True, None
+
+    verified, new_hash = verify_and_update(plain_password, hashed_password)
+    if verified:
+        verified_cache.set((username, new_hash or hashed_password), digest)
+    return verified, new_hash
 
 
-def create_access_token(username: str, user_id: int, expired_delta: timedelta):
-    encode = {"sub": username, "id": user_id}
+# role, active and ver (Users.token_version) let requests authorize without
+# reading the user back, see core/authz.py
+def create_access_token(
+    username: str,
+    user_id: int,
+    expired_delta: timedelta,
+    role: str = None,
+    active: bool = True,
+    version: int = 0,
+):
+    encode = {
+        "sub": username,
+        "id": user_id,
+        "role": role,
+        "active": active,
+        "ver": version,
+    }
     expires = datetime.utcnow() + expired_delta
     encode.update({"exp": expires})
 
@@ -26,4 +82,4 @@ def create_access_token(username: str, user_id: int, expired_delta: timedelta):
 
 
 def get_password_hash(password: str) -> str:
-    return bcrypt_context.hash(password)
+    return hashing_pool.run(pwd_context.hash, password)
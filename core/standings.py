@@ -0,0 +1,506 @@
+import threading
+import uuid
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+from sqlalchemy import case, func, literal, select, union_all
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from core.db import RoutingSession, get_params, notifier
+from core.head_to_head import HeadToHead
+from core.priority import compile_priority
+from schemas.db import Clubs, Matches, Params, Ranking
+
+# a checkpoint of the tallies is kept every SNAPSHOT_EVERY counted matches
+SNAPSHOT_EVERY = 20
+# historical tables cached, until a match before their end changes
+HISTORY_CACHE_SIZE = 64
+
+STANDINGS_CHANNEL = "standings_changed"
+
+
+def new_row(club_id: int) -> dict:
+    return {
+        "club_id": club_id,
+        "away_goals": 0,
+        "club_points": 0,
+        "club_win": 0,
+        "club_draw": 0,
+        "club_lost": 0,
+        "club_goals": 0,
+        "club_gconcede": 0,
+        "club_gdif": 0,
+        "show": True,
+    }
+
+
+# a match counts for the table once it is visible, finished and has a score.
+# COUNTED is the same rule as SQL clauses; every writer of the table uses
+# one of the two so they never disagree on which matches are played
+COUNTED = (
+    Matches.show == True,
+    Matches.finish != None,
+    Matches.goal1 != None,
+    Matches.goal2 != None,
+)
+
+
+def is_counted(match) -> bool:
+    return bool(
+        match.show
+        and match.finish is not None
+        and match.goal1 is not None
+        and match.goal2 is not None
+    )
+
+
+# (team1, team2, goal1, goal2) of a match that counts for the table, else None
+def match_result(match):
+    if not is_counted(match):
+        return None
+    return (match.team1, match.team2, match.goal1, match.goal2)
+
+
+# add (sign=1) or remove (sign=-1) one match result from the tallies
+def apply_result(rows: dict, result, sign: int = 1):
+    team1, team2, goal1, goal2 = result
+    home = rows.get(team1)
+    away = rows.get(team2)
+    if home is None or away is None:
+        return
+
+    home["club_goals"] += sign * goal1
+    away["club_goals"] += sign * goal2
+    away["away_goals"] += sign * goal2
+    home["club_gconcede"] += sign * goal2
+    away["club_gconcede"] += sign * goal1
+    home["club_gdif"] += sign * (goal1 - goal2)
+    away["club_gdif"] += sign * (goal2 - goal1)
+
+    if goal1 == goal2:
+        home["club_draw"] += sign
+        away["club_draw"] += sign
+    elif goal1 < goal2:
+        home["club_lost"] += sign
+        away["club_win"] += sign
+    else:
+        home["club_win"] += sign
+        away["club_lost"] += sign
+
+
+# the same tallies as apply_result, computed by the database in one grouped
+# query over the home and away side of every counted match
+def aggregate_rows(db: Session, club_ids=None) -> dict:
+    sides = union_all(
+        select(
+            Matches.team1.label("club_id"),
+            Matches.goal1.label("scored"),
+            Matches.goal2.label("conceded"),
+            literal(0).label("away"),
+        ).where(*COUNTED),
+        select(
+            Matches.team2.label("club_id"),
+            Matches.goal2.label("scored"),
+            Matches.goal1.label("conceded"),
+            Matches.goal2.label("away"),
+        ).where(*COUNTED),
+    ).subquery()
+
+    def count_if(cond):
+        return func.sum(case((cond, 1), else_=0))
+
+    query = select(
+        sides.c.club_id,
+        func.sum(sides.c.away),
+        count_if(sides.c.scored > sides.c.conceded),
+        count_if(sides.c.scored == sides.c.conceded),
+        count_if(sides.c.scored < sides.c.conceded),
+        func.sum(sides.c.scored),
+        func.sum(sides.c.conceded),
+    ).group_by(sides.c.club_id)
+    if club_ids is not None:
+        query = query.where(sides.c.club_id.in_(club_ids))
+
+    rows = {}
+    for club_id, away, win, draw, lost, goals, conceded in db.execute(query):
+        row = new_row(club_id)
+        row["away_goals"] = int(away)
+        row["club_win"] = int(win)
+        row["club_draw"] = int(draw)
+        row["club_lost"] = int(lost)
+        row["club_goals"] = int(goals)
+        row["club_gconcede"] = int(conceded)
+        row["club_gdif"] = int(goals) - int(conceded)
+        rows[club_id] = row
+
+    return rows
+
+
+def finalize(row: dict, params) -> dict:
+    res = dict(row)
+    res["club_points"] = (
+        row["club_win"] * params.points_win
+        + row["club_draw"] * params.points_draw
+        + row["club_lost"] * params.points_lose
+    )
+    return res
+
+
+class Standings:
+    """Per-club tallies kept in memory and moved by per-match deltas.
+
+    The first read builds the tallies from every visible match; after that
+    each score change only touches the two clubs of that match. The sorted
+    table is cached until a delta lands or the points/priority params change.
+
+    Historical tables ("as of" a time or round) replay the counted matches
+    in kick-off order from the nearest checkpoint, one of which is taken
+    every SNAPSHOT_EVERY matches.
+
+    Each change is announced on the notifier with its match id; the other
+    workers re-read those matches before their next read, and rebuild
+    everything after invalidate() or lost notifications.
+    """
+
+    def __init__(self, notifier):
+        self._lock = threading.RLock()
+        self._rows = None  # club_id -> tally
+        self._results = {}  # match_id -> result currently counted
+        self._starts = {}  # match_id -> kick-off of a counted match
+        self._pending = set()  # matches changed by another worker
+        self._view = None
+        self._view_key = None
+        self._h2h = None
+        self._h2h_key = None
+        self._timeline = None
+        self._history = {}
+        self.version = 0
+        self.notifier = notifier
+        # tags our own notifications, the notifier delivers them locally too
+        self.origin = uuid.uuid4().hex
+        notifier.subscribe(STANDINGS_CHANNEL, self._on_changed)
+
+    # call after committing a change to the clubs, every worker rebuilds
+    def invalidate(self):
+        self._reset()
+        self.notifier.publish(STANDINGS_CHANNEL, f"{self.origin}:*")
+
+    def _reset(self):
+        with self._lock:
+            self._rows = None
+            self._results = {}
+            self._starts = {}
+            self._pending = set()
+            self._changed()
+
+    # notifier callback: another worker changed a match (re-read on the next
+    # use) or the clubs (rebuild); None means notifications were lost
+    def _on_changed(self, payload):
+        origin, _, match_id = (payload or "").partition(":")
+        if payload is not None and origin == self.origin:
+            return
+        if not match_id.isdigit():
+            self._reset()
+            return
+        with self._lock:
+            self._pending.add(int(match_id))
+
+    # The current table is dropped on every change. History only from
+    # `since`, the earliest kick-off the change touched: the timeline keeps
+    # its checkpoints and the cached tables that end before it. None drops
+    # all of it.
+    def _changed(self, since=None):
+        self._view = None
+        self.version += 1
+
+        if since is None:
+            self._timeline = None
+            self._history = {}
+        elif self._timeline is not None:
+            keep = bisect_left(self._timeline["starts"], since)
+            self._timeline["valid"] = min(self._timeline["valid"], keep)
+            self._timeline["stale"] = True
+            self._history = {
+                key: table for key, table in self._history.items() if key[0] <= keep
+            }
+
+    # Built and caught up from the primary: a replica may not have the
+    # change another worker told us about yet, and a pending id is not
+    # looked at again once read.
+    def _ensure(self, db: Session):
+        if self._rows is not None and not self._pending:
+            return
+        if isinstance(db, RoutingSession):
+            db.use_primary()
+
+        if self._rows is None:
+            self._build(db)
+        elif self._pending:
+            pending, self._pending = self._pending, set()
+            matches = {
+                match.match_id: match
+                for match in db.query(Matches).filter(Matches.match_id.in_(pending))
+            }
+            for match_id in pending:
+                self._apply(match_id, matches.get(match_id))
+
+    def _build(self, db: Session):
+        self._pending = set()
+        clubs = db.query(Clubs.club_id).filter(Clubs.show == True).all()
+        matches = db.query(Matches).filter(*COUNTED).all()
+
+        rows = {club_id: new_row(club_id) for (club_id,) in clubs}
+        results = {}
+        starts = {}
+        for match in matches:
+            result = match_result(match)
+            results[match.match_id] = result
+            starts[match.match_id] = match.start or 0
+            apply_result(rows, result)
+
+        self._rows = rows
+        self._results = results
+        self._starts = starts
+        self._changed()
+
+        # clubs created without a Ranking row
+        missing = set(rows) - {club_id for (club_id,) in db.query(Ranking.club_id)}
+        if missing:
+            self._persist(db, missing)
+
+    # replace what is counted for the match by its current row (None when it
+    # is gone); returns the clubs whose tallies moved, None if nothing did
+    def _apply(self, match_id: int, match):
+        old = self._results.pop(match_id, None)
+        old_start = self._starts.pop(match_id, None)
+        new = match_result(match) if match is not None else None
+        new_start = (match.start or 0) if new is not None else None
+
+        if new is not None:
+            self._results[match_id] = new
+            self._starts[match_id] = new_start
+
+        if old == new:
+            # same score, but a moved kick-off reorders the history
+            if old_start != new_start:
+                self._changed(min(old_start, new_start))
+                return set()
+            return None
+
+        if old is not None:
+            apply_result(self._rows, old, -1)
+        if new is not None:
+            apply_result(self._rows, new)
+
+        self._changed(min(s for s in (old_start, new_start) if s is not None))
+
+        touched = set()
+        for result in (old, new):
+            if result is not None:
+                touched.update(result[:2])
+        return touched
+
+    # call after the match row is committed; safe to call more than once.
+    # The Ranking rows are written and the other workers notified through
+    # `db` in one transaction, a failure is raised to the caller
+    def apply_match(self, db: Session, match):
+        with self._lock:
+            self._ensure(db)
+            touched = self._apply(match.match_id, match)
+
+        if touched is None:
+            return
+        self._persist(db, touched, match.match_id)
+
+    # The Ranking rows of the clubs are recomputed from the matches rather
+    # than copied from the tallies, which may lag behind another worker's
+    # change. Locking the rows first orders concurrent writers, so the last
+    # one to write has seen every committed match.
+    def _persist(self, db: Session, club_ids, match_id=None):
+        if isinstance(db, RoutingSession):
+            db.use_primary()
+        params = get_params(Params, db)
+        # a row inserted by another worker in between fails our insert, the
+        # second attempt updates it
+        for attempt in range(2):
+            try:
+                if club_ids:
+                    db.query(Ranking).filter(
+                        Ranking.club_id.in_(club_ids)
+                    ).with_for_update().all()
+                    rows = aggregate_rows(db, club_ids)
+                    for club_id in club_ids:
+                        row = rows.get(club_id) or new_row(club_id)
+                        db.merge(Ranking(**finalize(row, params)))
+                if match_id is not None:
+                    self.notifier.publish(
+                        STANDINGS_CHANNEL, f"{self.origin}:{match_id}", session=db
+                    )
+                db.commit()
+                return
+            except IntegrityError:
+                db.rollback()
+                if attempt:
+                    self._notify_committed(match_id)
+                    raise
+            except Exception:
+                db.rollback()
+                self._notify_committed(match_id)
+                raise
+
+    # the match itself is committed, the other workers still have to hear
+    # about it when writing its Ranking rows failed
+    def _notify_committed(self, match_id):
+        if match_id is not None:
+            self.notifier.publish(STANDINGS_CHANNEL, f"{self.origin}:{match_id}")
+
+    @staticmethod
+    def _params_key(params):
+        return (
+            params.points_win,
+            params.points_draw,
+            params.points_lose,
+            params.priority,
+        )
+
+    def table(self, db: Session) -> list:
+        params = get_params(Params, db)
+        key = self._params_key(params)
+
+        with self._lock:
+            self._ensure(db)
+            if self._view is None or self._view_key != key:
+                rows = [finalize(row, params) for row in self._rows.values()]
+                sorter = compile_priority(params.priority)
+                self._view = sorter.sort(rows, self._head_to_head(params))
+                self._view_key = key
+            return self._view
+
+    # the matrix is built at most once per standings version and only when
+    # the priority actually has to break a tie by head-to-head
+    def _head_to_head(self, params):
+        def resolve(club_ids):
+            key = (
+                self.version,
+                params.points_win,
+                params.points_draw,
+                params.points_lose,
+            )
+            if self._h2h is None or self._h2h_key != key:
+                self._h2h = HeadToHead(
+                    list(self._results.values()),
+                    params.points_win,
+                    params.points_draw,
+                    params.points_lose,
+                )
+                self._h2h_key = key
+            return self._h2h.resolve(club_ids)
+
+        return resolve
+
+    # counted matches in kick-off order plus checkpoints of the tallies. The
+    # checkpoints within the part of the old timeline that is still valid
+    # are reused, the tallies are only replayed from the last of them.
+    def _build_timeline(self):
+        order = sorted(self._results, key=lambda m: (self._starts[m], m))
+        starts = [self._starts[m] for m in order]
+        results = [self._results[m] for m in order]
+
+        # matches played up to and including each matchday (calendar day)
+        round_ends = []
+        last_day = None
+        for i, start in enumerate(starts):
+            day = datetime.fromtimestamp(start).date()
+            if day != last_day:
+                if last_day is not None:
+                    round_ends.append(i)
+                last_day = day
+        if starts:
+            round_ends.append(len(starts))
+
+        checkpoints = []
+        if self._timeline is not None:
+            valid = self._timeline["valid"]
+            checkpoints = self._timeline["checkpoints"][: valid // SNAPSHOT_EVERY + 1]
+        if not checkpoints:
+            checkpoints = [{club_id: new_row(club_id) for club_id in self._rows}]
+
+        first = (len(checkpoints) - 1) * SNAPSHOT_EVERY
+        rows = {k: dict(v) for k, v in checkpoints[-1].items()}
+        for i in range(first, len(results)):
+            if i % SNAPSHOT_EVERY == 0 and i != first:
+                checkpoints.append({k: dict(v) for k, v in rows.items()})
+            apply_result(rows, results[i])
+        if len(results) % SNAPSHOT_EVERY == 0 and len(results) != first:
+            checkpoints.append({k: dict(v) for k, v in rows.items()})
+
+        self._timeline = {
+            "starts": starts,
+            "results": results,
+            "round_ends": round_ends,
+            "checkpoints": checkpoints,
+            # after a change: rebuilt on next use, from the leading `valid`
+            # matches that are still in place
+            "stale": False,
+            "valid": len(results),
+        }
+
+    # table after the first `count` matches of the timeline
+    def _table_after(self, count: int, params) -> list:
+        timeline = self._timeline
+        base = count // SNAPSHOT_EVERY
+
+        rows = {k: dict(v) for k, v in timeline["checkpoints"][base].items()}
+        for result in timeline["results"][base * SNAPSHOT_EVERY : count]:
+            apply_result(rows, result)
+
+        played = timeline["results"][:count]
+        matrix = []
+
+        def resolve(club_ids):
+            if not matrix:
+                matrix.append(
+                    HeadToHead(
+                        played,
+                        params.points_win,
+                        params.points_draw,
+                        params.points_lose,
+                    )
+                )
+            return matrix[0].resolve(club_ids)
+
+        rows = [finalize(row, params) for row in rows.values()]
+        return compile_priority(params.priority).sort(rows, resolve)
+
+    # table as of a unix time (matches kicked off at or before it) or after
+    # the given matchday (1 = first day with a counted match)
+    def table_as_of(self, db: Session, as_of: int = None, round: int = None) -> list:
+        params = get_params(Params, db)
+
+        with self._lock:
+            self._ensure(db)
+            if self._timeline is None or self._timeline["stale"]:
+                self._build_timeline()
+            timeline = self._timeline
+
+            if round is not None:
+                round_ends = timeline["round_ends"]
+                if round <= 0:
+                    count = 0
+                else:
+                    count = (
+                        round_ends[min(round, len(round_ends)) - 1] if round_ends else 0
+                    )
+            else:
+                count = bisect_right(timeline["starts"], as_of)
+
+            key = (count, self._params_key(params))
+            if key not in self._history:
+                if len(self._history) >= HISTORY_CACHE_SIZE:
+                    self._history.clear()
+                self._history[key] = self._table_after(count, params)
+            return self._history[key]
+
+
+standings = Standings(notifier)
@@ -1,17 +1,18 @@
 from datetime import datetime
 from fastapi import HTTPException
+from loguru import logger
 from sqlalchemy import func
-from core.db import db, db_deps
-from schemas.db import Users, Clubs, Players
-from core.security import verify_password, get_password_hash
+from core.db import db, db_deps, get_params
+from core.standings import standings
+from schemas.db import Users, Clubs, Players, Params
+from core.security import verify_password_cached, get_password_hash
 from api.deps import CurrentUser, Annotated, List
 from schemas.users import UserCreateBase, UserReg
 from schemas.clubs import Club_Create
 from utils import (
     is_valid_age,
-    check_club_player_num,
-    check_foreign_player,
     date_to_unix,
+    unix_to_date,
 )
 from schemas.players import Player_Add_With_Club
 
@@ -25,13 +26,19 @@ def authenticate_user(username: str, password: str, db: db_deps):
     if not user:
         return {"status": "error", "message": "Invalid username or password"}
 
-    try:
-        if not verify_password(password, user.password):
-            return {"status": "error", "message": "Invalid username or password"}
+    verified, new_hash = verify_password_cached(username, password, user.password)
+    if not verified:
+        return {"status": "error", "message": "Invalid username or password"}
 
-    except Exception:
-        if user.password != password:
-            return {"status": "error", "message": "Invalid username or password"}
+    # stored with an outdated scheme or cost, replace it while we know the
+    # password. Failing to do so does not fail the login
+    if new_hash is not None:
+        try:
+            user.password = new_hash
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Rehashing password of {username} failed: {str(e)}")
 
     return {"status": "success", "message": "Authentication successful", "data": user}
 
@@ -42,7 +49,7 @@ def create_user(db: db_deps, new_user: UserCreateBase) -> dict:
     duplicated_name = (
         db.query(Users).filter(Users.user_name == newUserdict["user_name"]).first()
     )
-    
+
     print("duplicated_name", duplicated_name)
 
     if duplicated_name is not None:
@@ -68,8 +75,7 @@ def create_user(db: db_deps, new_user: UserCreateBase) -> dict:
     newUserdict["user_bday"] = newUserdict["user_bday"]
     newUserdict["password"] = get_password_hash(newUserdict["password"])
     newUserdict["show"] = True
-    newUserdict["user_id"] = 1 + (db.query(func.max(Users.user_id)).scalar() or 0)
-    
+
     print(newUserdict)
 
     try:
@@ -154,93 +160,92 @@ def create_club(db: db_deps, current_user: CurrentUser, new_club: Club_Create) -
             return {"status": "error", "message": f"{key} is required."}
 
     # auto complete data
-    count = db.query(func.max(Clubs.club_id)).scalar()
-    new_club["club_id"] = (count or 1) + 1
     new_club["manager"] = current_user["user_id"]
     new_club["show"] = True
 
     # extract club's players info
     club_players = new_club.pop("club_players")
 
+    # the whole roster is checked in memory, against one params snapshot
+    params = get_params(Params, db)
+
     # check player num
-    if not check_club_player_num(db, len(club_players)):
-        db.rollback()
+    if not (params.min_club_player <= len(club_players) <= params.max_club_player):
         return {"status": "error", "message": "Club doesn't have enough players"}
 
     # check maximum foreign player
-    count = 0
-    for player in club_players:
-        if player.palyer_nation != "VIE":
-            count += 1
-    valid, max_foreign_player = check_foreign_player(db, count)
-    if not valid:
+    count = sum(1 for player in club_players if player["player_nation"] != "VIE")
+    if count > params.max_foreign_player:
         return {
             "status": "error",
-            "message": f"Too many foreign players (maximum is {max_foreign_player})",
+            "message": f"Too many foreign players (maximum is {params.max_foreign_player})",
         }
 
+    for player in club_players:
+        for key, value in player.items():
+            if value == "string":
+                return {"status": "error", "message": f"{key} is required."}
+        if not is_valid_age(
+            player["player_bday"],
+            MIN=params.min_player_age,
+            MAX=params.max_player_age,
+            overwrite=True,
+        ):
+            return {"status": "error", "message": "Player age is not legal"}
+        # unix time in the request, a DATE in the table
+        player["player_bday"] = unix_to_date(player["player_bday"])
+
+    # duplicated players, one query for the names of the whole roster
+    def player_key(player):
+        return (
+            player["player_name"],
+            player["player_bday"],
+            player["player_nation"],
+            player["player_pos"],
+            player["js_number"],
+        )
+
+    existing = {
+        (p.player_name, p.player_bday, p.player_nation, p.player_pos, p.js_number)
+        for p in db.query(Players).filter(
+            Players.show == True,
+            Players.player_name.in_({player["player_name"] for player in club_players}),
+        )
+    }
+    for player in club_players:
+        key = player_key(player)
+        if key in existing:
+            return {
+                "status": "error",
+                "message": f"Player {player['player_name']} already existed!",
+            }
+        existing.add(key)
+
     # add total players
     new_club["total_player"] = len(club_players)
 
-    # commit to database
+    # club and players in one transaction, either both are created or neither
     try:
         new_db_club = Clubs(**new_club)
         db.add(new_db_club)
-        db.commit()
-
-    except Exception as e:
-        return {
-            "status": "error",
-            "message": f"Internal Server Error: Can't create new club",
-        }
-
-    # add player
-    iter = 0
-    try:
-        for player in club_players:
-            # Kiểm tra cầu thủ trùng lặp
-            dup_player = (
-                db.query(Players)
-                .filter(Players.player_name == player["player_name"])
-                .first()
-            )
-            if dup_player is not None:
-                if (
-                    dup_player.player_bday == player["player_bday"]
-                    and dup_player.player_nation == player["player_nation"]
-                    and dup_player.player_pos == player["player_pos"]
-                    and dup_player.js_number == player["js_number"]
-                ):
-                    return {
-                        "status": "error",
-                        "message": f"Player {player['player_name']} already existed!",
-                    }
-            newPlayerDict = player
-            for key, value in newPlayerDict.items():
-                if value == "string":
-                    return {"status": "error", "message": f"{key} is required."}
-                if key == "player_bday" and not is_valid_age(value):
-                    return {"status": "error", "message": "Player age is not legal"}
-
-            count = db.query(func.max(Players.player_id)).scalar()
-            newPlayerDict["player_id"] = (count or 0) + 1 + iter
-            iter += 1
-            newPlayerDict["player_club"] = new_db_club.club_id
-            newPlayerDict["show"] = True
-            new_db_player = Players(**newPlayerDict)
-
-            db.add(new_db_player)
+        # the club id comes back from the sequence
+        db.flush()
 
+        # sent as one multi-row INSERT .. RETURNING
+        db.add_all(
+            Players(**player, player_club=new_db_club.club_id, show=True)
+            for player in club_players
+        )
         db.commit()
-        db.refresh(new_db_club)
-        return {
-            "status": "success",
-            "message": "Created club and players successfully!",
-            "data": new_db_club,
-        }
+
     except Exception as e:
         db.rollback()
-        db.query(Clubs).filter(Clubs.club_name == new_club["club_name"]).delete()
-        db.commit()
-
         return {"status": "error", "message": f"Internal Server Error: {str(e)}"}
+
+    db.refresh(new_db_club)
+    standings.invalidate()
+    return {
+        "status": "success",
+        "message": "Created club and players successfully!",
+        "data": new_db_club,
+    }
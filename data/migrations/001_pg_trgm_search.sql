@@ -0,0 +1,20 @@
+-- trigram similarity search on the name columns, see core/search.py.
+-- Skipped where the server does not ship pg_trgm (search then falls back to
+-- the in-process index); delete this row from schema_migrations to retry
+-- after installing it.
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        RAISE NOTICE 'pg_trgm is not available, skipping trigram indexes';
+        RETURN;
+    END IF;
+
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+    CREATE INDEX IF NOT EXISTS players_player_name_trgm ON players USING gin (player_name gin_trgm_ops);
+    CREATE INDEX IF NOT EXISTS clubs_club_name_trgm ON clubs USING gin (club_name gin_trgm_ops);
+    CREATE INDEX IF NOT EXISTS referees_ref_name_trgm ON referees USING gin (ref_name gin_trgm_ops);
+    CREATE INDEX IF NOT EXISTS users_full_name_trgm ON users USING gin (full_name gin_trgm_ops);
+    CREATE INDEX IF NOT EXISTS users_user_nation_trgm ON users USING gin (user_nation gin_trgm_ops);
+END
+$$;
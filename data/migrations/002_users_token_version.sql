@@ -0,0 +1,2 @@
+-- bumped to revoke every token issued to a user so far, see core/authz.py
+ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,33 @@
+-- Primary keys come from sequences instead of max(id) + 1. Tables from
+-- data/init.sql have no default on some of them; every sequence is moved
+-- past the ids handed out by max(id) + 1 so far.
+DO $$
+DECLARE
+    t record;
+    seq text;
+BEGIN
+    FOR t IN
+        SELECT * FROM (VALUES
+            ('users', 'user_id'),
+            ('clubs', 'club_id'),
+            ('players', 'player_id'),
+            ('referees', 'ref_id'),
+            ('matches', 'match_id'),
+            ('events', 'event_id'),
+            ('goaltypes', 'type_id'),
+            ('stadiums', 'std_id')
+        ) AS v (tbl, col)
+    LOOP
+        seq := pg_get_serial_sequence(t.tbl, t.col);
+        IF seq IS NULL THEN
+            seq := t.tbl || '_' || t.col || '_seq';
+            EXECUTE format('CREATE SEQUENCE IF NOT EXISTS %I OWNED BY %I.%I', seq, t.tbl, t.col);
+            EXECUTE format('ALTER TABLE %I ALTER COLUMN %I SET DEFAULT nextval(%L)', t.tbl, t.col, seq);
+        END IF;
+        EXECUTE format(
+            'SELECT setval(%L, COALESCE((SELECT max(%I) FROM %I), 0) + 1, false)',
+            seq, t.col, t.tbl
+        );
+    END LOOP;
+END
+$$;
@@ -1,14 +1,36 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from anyio import to_thread
 from api.main import router
+from core.config import config
+from core.db import db, notifier
+from core.migrations import apply_migrations
 import argparse
 import uvicorn
 from logger import RouterLoggingMiddleware
 from loguru import logger
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # route handlers are sync and run in anyio's worker threads, so let as many
+    # of them run at once as the database pool can serve. A handler may hold
+    # more than one connection; with every thread holding its share, none
+    # can wait on a pool that the others have used up
+    to_thread.current_default_thread_limiter().total_tokens = max(
+        1,
+        (config.DB_POOL_SIZE + config.DB_MAX_OVERFLOW)
+        // config.DB_CONNECTIONS_PER_REQUEST,
+    )
+    apply_migrations(db.engine, config.MIGRATIONS_PATH)
+    notifier.start()
+    yield
+    notifier.stop()
+
+
 def get_application() -> FastAPI:
-    app = FastAPI()
+    app = FastAPI(lifespan=lifespan)
 
     # TODO: fix origins in production
     app.add_middleware(
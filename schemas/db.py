@@ -23,6 +23,7 @@ class Users(Base):
     user_bday = Column(Integer, index=True)
     user_mail = Column(String, index=True)
     show = Column(Boolean, index=True)
+    token_version = Column(Integer, default=0, server_default="0", nullable=False)
 
 
 class Clubs(Base):
@@ -74,7 +75,7 @@ class Params(Base):
 class Referees(Base):
     __tablename__ = "referees"
 
-    ref_id = Column(Integer, primary_key=True, index=True)
+    ref_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     ref_name = Column(String, index=True)
     ref_bday = Column(Integer, index=True)
     ref_nation = Column(String, index=True)
@@ -85,7 +86,7 @@ class Referees(Base):
 class Matches(Base):
     __tablename__ = "matches"
 
-    match_id = Column(Integer, primary_key=True, index=True)
+    match_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     team1 = Column(Integer, ForeignKey("clubs.club_id"), index=True)
     team2 = Column(Integer, ForeignKey("clubs.club_id"), index=True)
     goal1 = Column(Integer, index=True)
@@ -102,7 +103,7 @@ class Matches(Base):
 class Events(Base):
     __tablename__ = "events"
 
-    event_id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     match_id = Column(Integer, ForeignKey("matches.match_id"), index=True)
     seconds = Column(Integer, index=True)
     events = Column(String, index=True)
@@ -115,7 +116,7 @@ class Events(Base):
 class GoalTypes(Base):
     __tablename__ = "goaltypes"
 
-    type_id = Column(Integer, primary_key=True, index=True)
+    type_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     type_name = Column(String, index=True)
     show = Column(Boolean, index=True)
 
@@ -137,7 +138,7 @@ class Ranking(Base):
 class Stadiums(Base):
     __tablename__ = "stadiums"
 
-    std_id = Column(Integer, primary_key=True, index=True)
+    std_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     std_name = Column(String, index=True)
     cap = Column(Integer, index=True)
     show = Column(Boolean, index=True)
\ No newline at end of file
@@ -4,7 +4,8 @@ from datetime import time, datetime
 from utils import get_params, db
 from schemas.db import Params, GoalTypes
 
-params = get_params(Params, db)
+with db.session() as session:
+    params = get_params(Params, session)
 
 
 class Show_Params(BaseModel):
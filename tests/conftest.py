@@ -0,0 +1,67 @@
+# The tests run against a throwaway SQLite file unless DATABASE_URL points
+# at a test database that data/init.sql and the migrations were applied to.
+# Settings come from .env, so they have to be in the environment before the
+# app is imported.
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TMP = tempfile.mkdtemp(prefix="se104-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{TMP}/primary.db")
+os.environ["POSTGRES_REPLICA_URLS"] = ""
+os.environ.setdefault("DB_POOL_SIZE", "20")
+
+from core.db import Base, db  # noqa: E402
+from core.db import params_cache  # noqa: E402
+from core.standings import standings  # noqa: E402
+from schemas.db import Params  # noqa: E402
+
+
+def make_params(session):
+    session.add(
+        Params(
+            min_player_age=16,
+            max_player_age=40,
+            min_club_player=15,
+            max_club_player=22,
+            max_foreign_player=3,
+            points_win=3,
+            points_draw=1,
+            points_lose=0,
+            max_goal_types=3,
+            max_goal_time=90,
+        )
+    )
+
+
+Base.metadata.create_all(bind=db.engine)
+# schemas/params.py reads the row on import
+with db.session() as session:
+    if session.query(Params).first() is None:
+        make_params(session)
+        session.commit()
+
+
+# every test starts from empty tables (but the params row) and cold caches
+@pytest.fixture(autouse=True)
+def clean_db():
+    with db.engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    with db.session() as session:
+        make_params(session)
+        session.commit()
+    params_cache.invalidate()
+    standings.invalidate()
+    yield
+
+
+@pytest.fixture
+def session():
+    with db.session() as session:
+        yield session
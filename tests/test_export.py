@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from core import export
+from core.config import config
+from core.security import create_access_token
+from main import app
+from schemas.db import Users
+
+EXPORTS = [
+    "/api/v1/players/export",
+    "/api/v1/matches/export",
+    "/api/v1/events/export",
+    "/api/v1/ranking/export",
+]
+
+
+# started once, stopping the notifier of the app takes a while on Postgres
+@pytest.fixture(scope="module")
+def app_client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def client(app_client, session):
+    user = Users(user_name="manager", role="manager", show=True, token_version=0)
+    session.add(user)
+    session.commit()
+
+    token = create_access_token(
+        "manager", user.user_id, timedelta(minutes=5), "manager"
+    )
+    app_client.headers["Authorization"] = f"Bearer {token}"
+    yield app_client
+    app_client.headers.pop("Authorization", None)
+
+
+@pytest.mark.parametrize("url", EXPORTS)
+def test_export_requires_a_user(client, url):
+    del client.headers["Authorization"]
+    assert client.get(url).status_code == 401
+
+
+@pytest.mark.parametrize("url", EXPORTS)
+def test_export(client, url):
+    res = client.get(url, params={"format": "csv"})
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/csv")
+
+
+def test_exports_over_the_limit_are_refused(client):
+    taken = 0
+    while export.export_slots.acquire(blocking=False):
+        taken += 1
+    try:
+        assert taken == config.EXPORT_MAX_CONCURRENT
+        assert client.get("/api/v1/players/export").status_code == 429
+    finally:
+        for _ in range(taken):
+            export.export_slots.release()
+
+
+def test_finished_exports_give_their_slot_back(client):
+    for _ in range(config.EXPORT_MAX_CONCURRENT + 2):
+        assert client.get("/api/v1/events/export").status_code == 200
@@ -0,0 +1,99 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from core.db import db
+from main import app
+from schemas.db import Clubs, Events, GoalTypes, Matches, Referees, Stadiums
+
+THREADS = 8
+PER_THREAD = 25
+
+
+@pytest.fixture
+def season(session):
+    session.add_all(
+        [
+            Clubs(club_id=1, club_name="A", show=True),
+            Clubs(club_id=2, club_name="B", show=True),
+        ]
+    )
+    session.flush()
+    match = Matches(team1=1, team2=2, start=0, show=True)
+    session.add(match)
+    session.commit()
+    return match.match_id
+
+
+# rows as the insert paths now add them, without an id
+NEW_ROWS = {
+    Referees: lambda i, match_id: Referees(
+        ref_name=f"Ref {i}", ref_nation="VIE", show=True
+    ),
+    Stadiums: lambda i, match_id: Stadiums(std_name=f"Stadium {i}", cap=i, show=True),
+    GoalTypes: lambda i, match_id: GoalTypes(type_name=f"Type {i}", show=True),
+    Matches: lambda i, match_id: Matches(team1=1, team2=2, start=i, show=True),
+    Events: lambda i, match_id: Events(
+        match_id=match_id, seconds=i, events="goal", team_id=1, show=True
+    ),
+}
+
+
+def run_concurrently(insert):
+    start = threading.Barrier(THREADS)
+    ids, errors = [], []
+
+    def worker(n):
+        start.wait()
+        for i in range(PER_THREAD):
+            try:
+                ids.append(insert(n * PER_THREAD + i))
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return ids, errors
+
+
+@pytest.mark.parametrize("model", list(NEW_ROWS), ids=lambda model: model.__name__)
+def test_concurrent_inserts_get_distinct_ids(season, model):
+    (key,) = model.__table__.primary_key.columns
+
+    def insert(i):
+        with db.session() as session:
+            row = NEW_ROWS[model](i, season)
+            session.add(row)
+            session.commit()
+            return getattr(row, key.name)
+
+    ids, errors = run_concurrently(insert)
+    assert errors == []
+    assert len(ids) == THREADS * PER_THREAD
+    assert len(set(ids)) == len(ids)
+
+
+def test_concurrent_add_refs_get_distinct_ids():
+    with TestClient(app) as client:
+
+        def insert(i):
+            res = client.post(
+                "/api/v1/referees/add-refs",
+                json={
+                    "ref_name": f"Ref {i}",
+                    "ref_bday": 0,
+                    "ref_nation": "VIE",
+                    "ref_mail": "ref@example.com",
+                },
+            )
+            assert res.status_code == 200, res.text
+            return res.json()["data"]["ref_id"]
+
+        ids, errors = run_concurrently(insert)
+
+    assert errors == []
+    assert len(set(ids)) == THREADS * PER_THREAD
@@ -0,0 +1,129 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.routes import auth
+from core.ratelimit import MemoryBackend, RateLimiter, TooManyAttempts
+from core.security import get_password_hash
+from main import app
+from schemas.db import Users
+
+
+def test_admits_up_to_the_limit():
+    limiter = RateLimiter(MemoryBackend(), limit=3, window=60)
+    for _ in range(3):
+        limiter.acquire("user:a")
+
+    with pytest.raises(TooManyAttempts) as refused:
+        limiter.acquire("user:a")
+    assert refused.value.status_code == 429
+    assert 1 <= int(refused.value.headers["Retry-After"]) <= 60
+    # other keys have their own count
+    limiter.acquire("user:b")
+
+
+def test_refused_acquire_records_nothing():
+    backend = MemoryBackend()
+    limiter = RateLimiter(backend, limit=1, window=60)
+    limiter.acquire("ip:1")
+
+    with pytest.raises(TooManyAttempts):
+        limiter.acquire("user:a", "ip:1")
+    # user:a was taken back when ip:1 refused
+    limiter.acquire("user:a")
+
+
+def test_release_refunds_an_attempt():
+    limiter = RateLimiter(MemoryBackend(), limit=2, window=60)
+    limiter.acquire("user:a")
+    attempt = limiter.acquire("user:a")
+    limiter.release(attempt)
+    limiter.acquire("user:a")
+
+    with pytest.raises(TooManyAttempts):
+        limiter.acquire("user:a")
+
+
+def test_reset_forgets_the_attempts():
+    limiter = RateLimiter(MemoryBackend(), limit=1, window=60)
+    limiter.acquire("user:a")
+    limiter.reset("user:a")
+    limiter.acquire("user:a")
+
+
+def test_parallel_burst_admits_exactly_the_limit():
+    limiter = RateLimiter(MemoryBackend(), limit=10, window=60)
+    start = threading.Barrier(40)
+    admitted = []
+
+    def attempt():
+        start.wait()
+        try:
+            limiter.acquire("user:a")
+            admitted.append(True)
+        except TooManyAttempts:
+            pass
+
+    threads = [threading.Thread(target=attempt) for _ in range(40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(admitted) == 10
+
+
+@pytest.fixture
+def client(monkeypatch, session):
+    backend = MemoryBackend()
+    for limiter in (auth.user_limiter, auth.ip_limiter):
+        monkeypatch.setattr(limiter, "backend", backend)
+        monkeypatch.setattr(limiter, "limit", 3)
+
+    session.add(
+        Users(
+            user_name="manager",
+            password=get_password_hash("secret"),
+            role="manager",
+            show=True,
+        )
+    )
+    session.commit()
+
+    with TestClient(app) as client:
+        yield client
+
+
+def login(client, password):
+    return client.post(
+        "/api/v1/auth/token", data={"username": "manager", "password": password}
+    )
+
+
+def test_login_failures_are_limited(client):
+    for _ in range(3):
+        res = login(client, "wrong")
+        assert res.status_code == 200
+        assert res.json()["status"] == "error"
+
+    # even the right password, the check is not spent on a locked out user
+    res = login(client, "secret")
+    assert res.status_code == 429
+    assert "Retry-After" in res.headers
+
+
+def test_successful_logins_are_not_counted(client):
+    for _ in range(5):
+        res = login(client, "secret")
+        assert res.status_code == 200
+        assert "access_token" in res.json()
+
+
+def test_successful_login_resets_the_user(client):
+    login(client, "wrong")
+    login(client, "wrong")
+    assert "access_token" in login(client, "secret").json()
+
+    # the user count starts over, the client IP still has its two failures
+    assert login(client, "wrong").json()["status"] == "error"
+    assert login(client, "wrong").status_code == 429
@@ -0,0 +1,99 @@
+import pytest
+from sqlalchemy import update
+
+from core.db import Base, Database
+from schemas.db import Stadiums
+
+
+# a primary and a replica that hold different rows, to tell them apart
+@pytest.fixture
+def routed(tmp_path):
+    def make(replica_max_lag=0):
+        database = Database(
+            f"sqlite:///{tmp_path}/primary.db",
+            pool_size=2,
+            max_overflow=0,
+            replica_urls=[f"sqlite:///{tmp_path}/replica.db"],
+            replica_max_lag=replica_max_lag,
+        )
+        for engine in [database.engine, *database.replicas]:
+            Base.metadata.create_all(bind=engine)
+            with engine.begin() as conn:
+                conn.execute(Stadiums.__table__.delete())
+                conn.execute(
+                    Stadiums.__table__.insert(),
+                    {"std_id": 1, "std_name": engine.url.database, "show": True},
+                )
+        return database
+
+    return make
+
+
+def stadium_name(session):
+    return session.get(Stadiums, 1).std_name
+
+
+def test_reads_go_to_the_replica(routed):
+    database = routed()
+    with database.read_session() as session:
+        assert session.replica is database.replicas[0]
+        assert stadium_name(session).endswith("replica.db")
+        assert not session.wrote
+
+
+def test_flush_goes_to_the_primary(routed):
+    database = routed()
+    with database.read_session() as session:
+        session.add(Stadiums(std_id=2, std_name="new", show=True))
+        session.flush()
+        assert session.wrote
+        # and so does everything after it, the request reads its own write
+        assert stadium_name(session).endswith("primary.db")
+        assert session.get(Stadiums, 2) is not None
+        session.commit()
+
+    with database.engine.connect() as conn:
+        assert conn.execute(Stadiums.__table__.select()).all()[-1].std_id == 2
+
+
+def test_update_statement_goes_to_the_primary(routed):
+    database = routed()
+    with database.read_session() as session:
+        session.execute(update(Stadiums).values(cap=10))
+        assert session.wrote
+        session.commit()
+
+    with database.engine.connect() as conn:
+        assert conn.execute(Stadiums.__table__.select()).one().cap == 10
+    with database.replicas[0].connect() as conn:
+        assert conn.execute(Stadiums.__table__.select()).one().cap is None
+
+
+def test_use_primary(routed):
+    database = routed()
+    with database.read_session() as session:
+        session.use_primary()
+        assert stadium_name(session).endswith("primary.db")
+
+
+def test_reads_stay_on_the_primary_after_a_commit(routed):
+    database = routed(replica_max_lag=60)
+    assert database.pick_replica() is database.replicas[0]
+
+    with database.session() as session:
+        session.get(Stadiums, 1).cap = 10
+        session.commit()
+
+    assert database.pick_replica() is None
+    with database.read_session() as session:
+        assert session.replica is None
+        assert stadium_name(session).endswith("primary.db")
+
+
+def test_reads_go_back_to_the_replica_after_the_lag(routed):
+    database = routed(replica_max_lag=0)
+    with database.session() as session:
+        session.get(Stadiums, 1).cap = 10
+        session.commit()
+
+    assert database.pick_replica() is database.replicas[0]
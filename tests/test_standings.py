@@ -0,0 +1,99 @@
+from core.db import Base, Database, db
+from core.notify import LocalNotifier
+from core.standings import Standings
+from schemas.db import Clubs, Matches, Ranking
+from conftest import make_params
+
+
+def add_season(session, goal1, goal2):
+    session.add_all(
+        [
+            Clubs(club_id=1, club_name="A", show=True),
+            Clubs(club_id=2, club_name="B", show=True),
+        ]
+    )
+    session.flush()
+    session.add(
+        Matches(
+            match_id=1,
+            team1=1,
+            team2=2,
+            goal1=goal1,
+            goal2=goal2,
+            start=1000,
+            finish=2000,
+            show=True,
+        )
+    )
+    session.commit()
+
+
+def points(table):
+    return {row["club_id"]: row["club_points"] for row in table}
+
+
+# a replica that still has the old score, and every read allowed on it
+def lagging_replica(tmp_path):
+    routed = Database(
+        str(db.engine.url),
+        pool_size=2,
+        max_overflow=0,
+        replica_urls=[f"sqlite:///{tmp_path}/replica.db"],
+        replica_max_lag=0,
+    )
+    Base.metadata.create_all(bind=routed.replicas[0])
+    with routed.SessionLocal(bind=routed.replicas[0]) as replica:
+        make_params(replica)
+        add_season(replica, 1, 0)
+    return routed
+
+
+def test_change_from_another_worker_is_read_from_the_primary(tmp_path, session):
+    add_season(session, 1, 0)
+    standings = Standings(LocalNotifier())
+    assert points(standings.table(session)) == {1: 3, 2: 0}
+
+    routed = lagging_replica(tmp_path)
+    match = session.get(Matches, 1)
+    match.goal1, match.goal2 = 0, 2
+    session.commit()
+    standings._on_changed("another-worker:1")
+
+    with routed.read_session() as read:
+        assert read.replica is not None
+        assert points(standings.table(read)) == {1: 0, 2: 3}
+    # and the change is not lost once read
+    assert points(standings.table(session)) == {1: 0, 2: 3}
+
+
+def test_rebuild_is_read_from_the_primary(tmp_path, session):
+    add_season(session, 0, 2)
+    routed = lagging_replica(tmp_path)
+    standings = Standings(LocalNotifier())
+
+    with routed.read_session() as read:
+        assert read.replica is not None
+        assert points(standings.table(read)) == {1: 0, 2: 3}
+
+
+def test_build_creates_missing_ranking_rows(session):
+    add_season(session, 1, 1)
+    standings = Standings(LocalNotifier())
+    standings.table(session)
+
+    rows = {row.club_id: row.club_points for row in session.query(Ranking)}
+    assert rows == {1: 1, 2: 1}
+
+
+def test_apply_match_writes_the_ranking_rows(session):
+    add_season(session, 1, 1)
+    standings = Standings(LocalNotifier())
+    standings.table(session)
+
+    match = session.get(Matches, 1)
+    match.goal1 = 3
+    session.commit()
+    standings.apply_match(session, match)
+
+    rows = {row.club_id: row.club_points for row in session.query(Ranking)}
+    assert rows == {1: 3, 2: 0}
@@ -1,9 +1,13 @@
 from datetime import date, datetime, time, timedelta
 from fastapi import HTTPException
-from fuzzywuzzy import fuzz
-from sqlalchemy import select, exists, or_, func
+from sqlalchemy import case, select, exists, or_, func
+from sqlalchemy.orm import Session
 
 from core.db import db_deps, get_params, db
+from core.db import db as database
+from core.standings import standings
+from core.fuzzy_index import fuzzy_rows
+from core.authz import get_principal_access
 from api.deps import CurrentUser
 
 from schemas.db import (
@@ -49,12 +53,10 @@ def is_admin(db: db_deps, current_user: CurrentUser):
     if current_user is None:
         raise HTTPException(status_code=401, detail="Authentication Failed")
 
-    user_role = (
-        db.query(Users).filter(Users.user_id == current_user["user_id"]).first().role  # type: ignore
-    )
+    access = get_principal_access(db, current_user)
 
     # check permission of user_role
-    if user_role != "admin":
+    if access is None or access.role != "admin":
         raise HTTPException(
             status_code=401, detail="You don't have permission to do this action!"
         )
@@ -62,7 +64,8 @@ def is_admin(db: db_deps, current_user: CurrentUser):
     return True
 
 
-params = get_params(Params, db)
+with db.session() as session:
+    params = get_params(Params, session)
 # default values
 MIN_PLAYER_AGE = 16
 MAX_PLAYER_AGE = 40
@@ -78,10 +81,18 @@ MAX_GOAL_TIME = "01:30:00"
 
 # overwrite to use when update params, checking conflict data with new MIN/MAX age
 def is_valid_age(
-    bday: int, db: db = db, MIN: int = 16, MAX: int = 40, overwrite: bool = False
+    bday: int,
+    db: Session = None,
+    MIN: int = 16,
+    MAX: int = 40,
+    overwrite: bool = False,
 ):
     if not overwrite:
-        params = get_params(Params, db)
+        if db is None:
+            with database.session() as session:
+                params = get_params(Params, session)
+        else:
+            params = get_params(Params, db)
         MIN_PLAYER_AGE = params.min_player_age
         MAX_PLAYER_AGE = params.max_player_age
     else:
@@ -115,30 +126,26 @@ def get_user_role(db: db_deps, current_user: CurrentUser):
     if current_user is None:
         raise HTTPException(status_code=401, detail="Authentication Failed")
 
-    user_role = (
-        db.query(Users).filter(Users.user_id == current_user["user_id"]).first().role  # type: ignore
-    )
+    access = get_principal_access(db, current_user)
+    if access is None:
+        raise HTTPException(status_code=401, detail="Authentication Failed")
 
-    return user_role
+    return access.role
 
 
 def check_is_manager(db: db_deps, current_user: CurrentUser):
     if current_user is None:
         raise HTTPException(status_code=401, detail="Authentication Failed")
 
-    user_role = (
-        db.query(Users).filter(Users.user_id == current_user["user_id"]).first().role  # type: ignore
-    )
+    access = get_principal_access(db, current_user)
+    if access is None:
+        raise HTTPException(status_code=401, detail="Authentication Failed")
+    user_role = access.role
 
     # check permission of user_role
     if user_role == "manager":
         # check if user is deleted or not
-        if (
-            not db.query(Users)
-            .filter(Users.user_id == current_user["user_id"])
-            .first()
-            .show  # type: ignore
-        ):
+        if not access.show:
             raise HTTPException(
                 status_code=401, detail="Your account is no longer active!"
             )
@@ -211,23 +218,14 @@ def is_int(var: str):
 
 
 # convert
-def convert_from_attr(model, value, src_field, res_field, from_name: bool = False):
+def convert_from_attr(
+    db: Session, model, value, src_field, res_field, from_name: bool = False
+):
     if from_name:
-        records = db.query(model).filter(getattr(model, "show") == True).all()
-        res = None
-        ratio = 90
-        for record in records:
-            current_ratio = fuzz.partial_ratio(
-                str(getattr(record, src_field)).lower(), value.lower()
-            )
-
-            if current_ratio > ratio:
-                res = record
-                ratio = current_ratio
-
-        if res:
-            res = getattr(res, res_field)
-            return res
+        # best match scoring above 90, the first one by id on ties
+        records = fuzzy_rows(db, model, src_field, value, 91)
+        if records:
+            return getattr(records[0], res_field)
         return None
     else:
         res = (
@@ -249,7 +247,7 @@ def valid_add_match(
     team1 = None
     team2 = None
     if not is_int(match.team1):
-        team1 = convert_from_attr(Clubs, match.team1, "club_name", "club_id", True)
+        team1 = convert_from_attr(db, Clubs, match.team1, "club_name", "club_id", True)
     else:
         team1 = int(match.team1)
         target = (
@@ -259,7 +257,7 @@ def valid_add_match(
             raise HTTPException(status_code=400, detail=f"Invalid team1")
 
     if not is_int(match.team2):
-        team2 = convert_from_attr(Clubs, match.team2, "club_name", "club_id", True)
+        team2 = convert_from_attr(db, Clubs, match.team2, "club_name", "club_id", True)
     else:
         team2 = int(match.team2)
         target = (
@@ -308,7 +306,7 @@ def valid_add_match(
     var = None
     lineman = None
     if not is_int(match.ref):
-        ref = convert_from_attr(Referees, match.ref, "ref_name", "ref_id", True)
+        ref = convert_from_attr(db, Referees, match.ref, "ref_name", "ref_id", True)
     else:
         ref = int(match.ref)
         target = (
@@ -320,7 +318,7 @@ def valid_add_match(
             raise HTTPException(status_code=400, detail=f"Referee not found !")
 
     if not is_int(match.var):
-        var = convert_from_attr(Referees, match.var, "ref_name", "ref_id", True)
+        var = convert_from_attr(db, Referees, match.var, "ref_name", "ref_id", True)
     else:
         var = int(match.var)
         target = (
@@ -332,7 +330,9 @@ def valid_add_match(
             raise HTTPException(status_code=400, detail=f"Var referee not found !")
 
     if not is_int(match.lineman):
-        lineman = convert_from_attr(Referees, match.lineman, "ref_name", "ref_id", True)
+        lineman = convert_from_attr(
+            db, Referees, match.lineman, "ref_name", "ref_id", True
+        )
     else:
         lineman = int(match.lineman)
         target = (
@@ -470,46 +470,94 @@ def check_event_time(db: db_deps, time: int):
 
 
 # AUTO COUNT GOALS FOR A MATCH
+# one grouped query over the visible events, by the team each one is for
 def count_goals(db: db_deps, match_id: int):
-    events = (
-        db.query(Events)
-        .filter(
-            Events.match_id == match_id,
-            Events.show == True,
+    counts = (
+        db.query(
+            func.count(Events.event_id).filter(Events.team_id == Matches.team1),
+            func.count(Events.event_id).filter(Events.team_id == Matches.team2),
+        )
+        .select_from(Matches)
+        .outerjoin(
+            Events, (Events.match_id == Matches.match_id) & (Events.show == True)
         )
-        .all()
-    )
-
-    target = (
-        db.query(Matches)
         .filter(Matches.show == True, Matches.match_id == match_id)
+        .group_by(Matches.match_id)
         .first()
     )
 
-    if not target:
+    if not counts:
         raise HTTPException(status_code=400, detail="Can't find any matches !")
 
-    goal1 = 0
-    goal2 = 0
+    goal1, goal2 = counts
+    return goal1, goal2
 
-    if len(events) == 0:
-        return goal1, goal2
 
-    # count
-    for event in events:
-        player = (
-            db.query(Players)
-            .filter(Players.show == True, Players.player_id == event.player_id)
-            .first()
+# Move the scores by the goal events added (+1) or removed (-1) in the
+# current transaction, given as [(match_id, team_id, delta)], commit, and
+# pass the new scores on to the standings. The scores are incremented in
+# SQL, so the cost does not grow with the number of events and concurrent
+# event writes do not overwrite each other. A score that is still NULL
+# (never set, or reset by update-result) has no count to move, it is
+# recounted from the events instead. Returns {match_id: match} of the
+# updated matches.
+def apply_goal_deltas(db: db_deps, deltas):
+    by_match = {}
+    for match_id, team_id, delta in deltas:
+        teams = by_match.setdefault(match_id, {})
+        teams[team_id] = teams.get(team_id, 0) + delta
+
+    # new value of one side's score, `teams` is {team_id: delta} of the match
+    def goals(goal, team, teams):
+        recount = (
+            select(func.count(Events.event_id))
+            .where(
+                Events.match_id == Matches.match_id,
+                Events.team_id == team,
+                Events.show == True,
+            )
+            .scalar_subquery()
+        )
+        delta = case(
+            *((team == team_id, delta) for team_id, delta in teams.items()),
+            else_=0,
+        )
+        # not greatest(), SQLite does not have it
+        return case(
+            (goal == None, recount),
+            (goal + delta < 0, 0),
+            else_=goal + delta,
         )
-        if player.player_club == target.team1:
-            goal1 += 1
-        if player.player_club == target.team2:
-            goal2 += 1
 
-    return goal1, goal2
+    # the recount has to see the event changes of this transaction
+    db.flush()
+    for match_id, teams in by_match.items():
+        db.query(Matches).filter(Matches.match_id == match_id).update(
+            {
+                Matches.goal1: goals(Matches.goal1, Matches.team1, teams),
+                Matches.goal2: goals(Matches.goal2, Matches.team2, teams),
+            },
+            synchronize_session=False,
+        )
+
+    try:
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+    targets = {}
+    for match_id in by_match:
+        target = db.get(Matches, match_id)
+        if target is not None:
+            db.refresh(target)
+            standings.apply_match(db, target)
+            targets[match_id] = target
+    return targets
 
+
+# recount the score of a match from its events, see apply_goal_deltas() for
+# the incremental version
 def update_match(db: db_deps, match_id: int):
     target = (
         db.query(Matches)
@@ -530,4 +578,6 @@ def update_match(db: db_deps, match_id: int):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+    standings.apply_match(db, target)
+
     return target